@@ -0,0 +1,112 @@
+"""
+    Areas of interest (bounding box or GeoJSON geometry), clipping band files to the window covering them
+"""
+
+import os
+import math
+import json
+import hashlib
+from .errors import SatProcessError
+try:
+    from osgeo import gdal, osr
+except ImportError:
+    gdal = None
+    osr = None
+
+
+def coordinates(geojson):
+    """ Generate (x, y) of all positions in a GeoJSON geometry, Feature or FeatureCollection """
+    if geojson.get('type') == 'FeatureCollection':
+        for f in geojson['features']:
+            for xy in coordinates(f):
+                yield xy
+    elif geojson.get('type') == 'Feature':
+        for xy in coordinates(geojson['geometry']):
+            yield xy
+    elif geojson.get('type') == 'GeometryCollection':
+        for g in geojson['geometries']:
+            for xy in coordinates(g):
+                yield xy
+    else:
+        stack = [geojson['coordinates']]
+        while len(stack) > 0:
+            c = stack.pop()
+            if len(c) > 0 and not isinstance(c[0], (list, tuple)):
+                yield c[0], c[1]
+            else:
+                stack.extend(c)
+
+
+def bounds(aoi, srs=None):
+    """ Get (minx, miny, maxx, maxy) of aoi in srs (WKT). aoi is a bounding box in srs, or a GeoJSON
+        geometry in longitude and latitude """
+    if not isinstance(aoi, dict):
+        if len(aoi) != 4 or aoi[0] >= aoi[2] or aoi[1] >= aoi[3]:
+            raise SatProcessError('invalid bounding box %s, use (minx, miny, maxx, maxy)' % (aoi,))
+        return tuple(aoi)
+    xys = list(coordinates(aoi))
+    if len(xys) == 0:
+        raise SatProcessError('GeoJSON AOI has no coordinates')
+    if srs is not None:
+        src = osr.SpatialReference()
+        src.ImportFromEPSG(4326)
+        dst = osr.SpatialReference()
+        dst.ImportFromWkt(srs)
+        for s in [src, dst]:
+            if hasattr(s, 'SetAxisMappingStrategy'):
+                s.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        trans = osr.CoordinateTransformation(src, dst)
+        xys = [trans.TransformPoint(x, y)[:2] for x, y in xys]
+    xs, ys = zip(*xys)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def key(aoi):
+    """ Short identifier of an aoi """
+    return hashlib.sha1(json.dumps(aoi, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+
+
+def window(gt, xsize, ysize, box):
+    """ Get pixel window (x0, y0, width, height) of a north-up raster with geotransform gt
+        covering box, or None if they do not intersect """
+    cols = [(box[0] - gt[0]) / gt[1], (box[2] - gt[0]) / gt[1]]
+    rows = [(box[1] - gt[3]) / gt[5], (box[3] - gt[3]) / gt[5]]
+    x0 = max(int(math.floor(min(cols) + 1e-6)), 0)
+    x1 = min(int(math.ceil(max(cols) - 1e-6)), xsize)
+    y0 = max(int(math.floor(min(rows) + 1e-6)), 0)
+    y1 = min(int(math.ceil(max(rows) - 1e-6)), ysize)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def clip(filenames, aoi, path):
+    """ Get VRT files in path of the windows of filenames covering aoi. The window is snapped to
+        the grid of the coarsest file so files at different resolutions stay aligned. VRTs only
+        reference the files, and are written every time so they reference the current files
+        (fingerprints of VRTs are of the files they reference, see satprocess.cache.fingerprint) """
+    if gdal is None:
+        raise SatProcessError('GDAL Python bindings (osgeo) required for AOI')
+    dss = [gdal.Open(f) for f in filenames]
+    if any([ds is None for ds in dss]):
+        raise SatProcessError('unable to open files for AOI')
+    coarsest = max(dss, key=lambda ds: abs(ds.GetGeoTransform()[1]))
+    gt = coarsest.GetGeoTransform()
+    win = window(gt, coarsest.RasterXSize, coarsest.RasterYSize, bounds(aoi, srs=coarsest.GetProjection()))
+    if win is None:
+        raise SatProcessError('AOI does not intersect scene')
+    # snapped box in georeferenced coordinates
+    box = [gt[0] + win[0] * gt[1], gt[3] + (win[1] + win[3]) * gt[5],
+           gt[0] + (win[0] + win[2]) * gt[1], gt[3] + win[1] * gt[5]]
+    if not os.path.exists(path):
+        os.makedirs(path)
+    vrts = []
+    for filename, ds in zip(filenames, dss):
+        vrt = os.path.join(path, os.path.splitext(os.path.basename(filename))[0] + '.vrt')
+        w = window(ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize, box)
+        out = gdal.Translate(vrt, ds, format='VRT', srcWin=list(w))
+        if out is None:
+            raise SatProcessError('failed clipping %s to AOI' % filename)
+        out = None
+        vrts.append(vrt)
+    return vrts
@@ -0,0 +1,277 @@
+"""
+    Batch processing of many scenes over a pool of worker processes
+"""
+
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+import traceback
+from multiprocessing import Pool, Array, cpu_count
+from .prefetch import Prefetcher
+from .catalog import walk
+from .workqueue import WorkQueue
+
+
+logger = logging.getLogger(__name__)
+
+
+# seconds between checks on scenes in flight in process_scenes
+POLL = 0.1
+
+# shared array of the pids of workers processing scenes in process_scenes, one slot per scene in flight
+_workers = None
+
+
+def _init_worker(workers=None):
+    """ Import gippy (and register GDAL drivers) once per worker, not once per scene """
+    global _workers
+    _workers = workers
+    import gippy  # noqa
+
+
+def _process_scene(slot, job):
+    """ Process a scene in a pool worker, noting the worker's pid in its slot """
+    _workers[slot] = os.getpid()
+    return process_scene(job)
+
+
+def _alive(pid):
+    """ Whether process pid is running """
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def process_scene(job):
+    """ Open and process a single scene, returning a summary of the result """
+    cls, path, products, outpath, kwargs = job
+    summary = {'scene': path, 'products': {}, 'error': None}
+    start = time.time()
+    try:
+        # the manifest in outpath means a rerun only rebuilds products that are out of date
+        with cls.create_from_directory(path, outpath=outpath, manifest=True) as scene:
+            summary['scene'] = scene.basename
+            scene.process(products, **kwargs)
+            summary['products'] = {p: scene[p].filename for p in products}
+    except Exception as e:
+        summary['error'] = '%s: %s' % (e.__class__.__name__, e)
+        logger.debug(traceback.format_exc())
+    summary['time'] = time.time() - start
+    return summary
+
+
+def process_scenes(cls, paths, products, outpath='./', processes=None, prefetcher=None, **kwargs):
+    """ Process products for many scene directories using a pool of processes
+
+        Each worker process opens its own instance of Scene class cls for every
+        directory in paths. Keywords are passed to Scene.process. Summaries are
+        yielded as scenes complete. With a satprocess.prefetch.Prefetcher, the
+        files of upcoming scenes are staged while the current ones are processed.
+        Scenes lost with a worker process that dies, or to an error outside the
+        worker (e.g., pickling the job), are yielded as failed """
+    processes = cpu_count() if processes is None else processes
+    staged = ((path, path) for path in paths) if prefetcher is None else prefetcher.stage(paths)
+
+    def job(path):
+        return (cls, path, products, outpath, kwargs)
+
+    def release(path):
+        if prefetcher is not None:
+            prefetcher.release(path)
+
+    if processes <= 1:
+        # run in this process, mostly useful for debugging
+        for path, spath in staged:
+            summary = process_scene(job(spath))
+            release(path)
+            yield summary
+        return
+    # scenes in flight, {slot: (path, AsyncResult, start time)}
+    pending = {}
+    # scenes lost with their worker, which the pool would wait for forever on closing
+    lost = []
+    workers = Array('l', processes)
+    pool = Pool(processes=processes, initializer=_init_worker, initargs=(workers,))
+
+    def wait():
+        """ Wait for a scene to finish, returning (slot, summary). A scene lost to an error
+            outside process_scene (e.g., pickling), or to its worker dying, has failed """
+        while True:
+            for slot, (path, result, start) in sorted(pending.items(), key=lambda item: item[1][2]):
+                error = None
+                if result.ready():
+                    try:
+                        return slot, result.get()
+                    except Exception as e:
+                        error = '%s: %s' % (e.__class__.__name__, e)
+                elif workers[slot] != 0 and not _alive(workers[slot]):
+                    error = 'worker process %s died' % workers[slot]
+                    lost.append(path)
+                if error is not None:
+                    return slot, {'scene': path, 'products': {}, 'error': error, 'time': time.time() - start}
+            min(pending.values(), key=lambda p: p[2])[1].wait(POLL)
+
+    def finish():
+        slot, summary = wait()
+        path = pending.pop(slot)[0]
+        release(path)
+        return summary
+
+    try:
+        for path, spath in staged:
+            slot = min(set(range(processes)) - set(pending))
+            workers[slot] = 0
+            pending[slot] = (path, pool.apply_async(_process_scene, (slot, job(spath))), time.time())
+            # only as many scenes in flight as processes, so prefetching stays just ahead
+            if len(pending) >= processes:
+                yield finish()
+        while len(pending) > 0:
+            yield finish()
+        if len(lost) > 0:
+            pool.terminate()
+        else:
+            pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def scene_directories(cls, path):
+    """ Generate directories under path with files matching the pattern of Scene class cls """
+    regex = cls.regex()
+    for d, files in walk(path):
+        if any([regex.match(f) for f in files]):
+            yield d
+
+
+def enqueue(queue, paths, products, outpath='./', **kwargs):
+    """ Add a task to queue for each scene directory in paths, returning number added.
+        Tasks are identified by the scene, products, outpath and options, so a scene is
+        queued again only when any of them change """
+    added = 0
+    for path in paths:
+        payload = {'path': path, 'products': products, 'outpath': outpath, 'kwargs': kwargs}
+        job = {'products': sorted(products), 'outpath': os.path.abspath(outpath), 'kwargs': kwargs}
+        digest = hashlib.sha1(json.dumps(job, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        added += queue.put('%s:%s' % (os.path.abspath(path), digest), payload)
+    return added
+
+
+def work(queue, cls, heartbeat=60, worker=None):
+    """ Claim and process scenes from queue until none are left, renewing the lease every
+        heartbeat seconds while a scene is processed. Generates summaries of scenes """
+    worker = '%s:%s' % (socket.gethostname(), os.getpid()) if worker is None else worker
+    while True:
+        task = queue.claim(worker)
+        if task is None:
+            return
+        id, payload = task
+        job = (cls, payload['path'], payload['products'], payload['outpath'], payload['kwargs'])
+        result = []
+        thread = threading.Thread(target=lambda: result.append(process_scene(job)))
+        thread.daemon = True
+        thread.start()
+        while thread.is_alive():
+            thread.join(heartbeat)
+            if thread.is_alive() and not queue.heartbeat(id, worker):
+                logger.warning('%s: lease on %s lost' % (worker, id))
+        summary = result[0]
+        if summary['error'] is None:
+            queue.ack(id, worker)
+        else:
+            queue.fail(id, worker, summary['error'])
+        yield summary
+
+
+def _work_queue(args):
+    """ Work a queue file in a worker process """
+    cls, filename, heartbeat = args
+    queue = WorkQueue(filename)
+    try:
+        return list(work(queue, cls, heartbeat=heartbeat))
+    finally:
+        queue.close()
+
+
+def work_queue(cls, filename, processes=None, heartbeat=60):
+    """ Work a queue file with a pool of processes, returning summaries of scenes processed.
+        Any number of nodes sharing the file can work the same queue """
+    processes = cpu_count() if processes is None else processes
+    jobs = [(cls, filename, heartbeat)] * max(processes, 1)
+    if processes <= 1:
+        return _work_queue(jobs[0])
+    pool = Pool(processes=processes, initializer=_init_worker)
+    try:
+        results = pool.map(_work_queue, jobs)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return sum(results, [])
+
+
+def print_summary(summaries):
+    """ Print a per-scene success/failure summary, returning number of failures """
+    failures = 0
+    for s in summaries:
+        if s['error'] is None:
+            print('%s: OK (%.1fs) %s' % (s['scene'], s['time'], ' '.join(sorted(s['products']))))
+        else:
+            failures += 1
+            print('%s: FAILED (%.1fs) %s' % (s['scene'], s['time'], s['error']))
+    print('%s scenes processed, %s failed' % (len(summaries), failures))
+    return failures
+
+
+def add_batch_parser(parser):
+    """ Add batch processing arguments to an argparse parser """
+    group = parser.add_argument_group('batch processing')
+    group.add_argument('--processes', help='Number of worker processes', type=int, default=cpu_count())
+    group.add_argument('--prefetch', help='Number of scenes to stage ahead of processing', type=int, default=0)
+    group.add_argument('--prefetch-budget', help='Maximum MB of staged scene files', type=int, default=4096)
+    group.add_argument('--scratch', help='Copy staged scenes to this local directory', default=None)
+    group.add_argument('--queue', help='Queue scenes (or all scenes under --indir) in this SQLite file and process '
+                       'them from it, run on more nodes to share the work', default=None)
+    return group
+
+
+def run(cls, args):
+    """ Run a batch from parsed command line arguments, returning an exit code """
+    kwargs = {'cog': True} if args.cog else {}
+    if getattr(args, 'masked', False):
+        kwargs['masked'] = True
+    if args.queue is not None:
+        indir = '' if args.indir is None else args.indir
+        if args.sceneids:
+            paths = [os.path.join(indir, sid) for sid in args.sceneids]
+        else:
+            paths = [] if args.indir is None else scene_directories(cls, args.indir)
+        queue = WorkQueue(args.queue)
+        enqueue(queue, paths, args.products, outpath=args.outdir, **kwargs)
+        queue.close()
+        summaries = work_queue(cls, args.queue, processes=args.processes)
+        return 1 if print_summary(summaries) else 0
+    if args.sceneids:
+        indir = '' if args.indir is None else args.indir
+        paths = [os.path.join(indir, sid) for sid in args.sceneids]
+    elif args.indir is not None:
+        paths = [args.indir]
+    else:
+        print('Provide scene IDs and/or an input directory')
+        return 1
+    prefetcher = None
+    if args.prefetch > 0:
+        prefetcher = Prefetcher(depth=args.prefetch, budget=args.prefetch_budget * 2 ** 20, scratch=args.scratch)
+    summaries = list(process_scenes(cls, paths, args.products, outpath=args.outdir, processes=args.processes,
+                                    prefetcher=prefetcher, **kwargs))
+    return 1 if print_summary(summaries) else 0
@@ -0,0 +1,146 @@
+"""
+    Benchmarks of scene construction and product processing on synthetic data
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import resource
+from multiprocessing import Pool
+import numpy as np
+from gippy import GeoImage
+from .landsat8 import Landsat8Scene
+from .sentinel2 import Sentinel2Scene
+
+
+SENSORS = {
+    'landsat8': {
+        'class': Landsat8Scene,
+        'bands': ['B1', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B9', 'BQA'],
+        'extension': 'TIF',
+        'products': ['dc', 'rad', 'toa', 'ndvi', 'evi', 'color'],
+    },
+    'sentinel2': {
+        'class': Sentinel2Scene,
+        'bands': ['B01', 'B02', 'B03', 'B04', 'B08', 'B10', 'B11', 'B12'],
+        'extension': 'jp2',
+        'products': ['toa', 'ndvi', 'evi', 'color'],
+    }
+}
+
+MTL = """GROUP = L1_METADATA_FILE
+  SUN_ELEVATION = 45.0
+  EARTH_SUN_DISTANCE = 1.0
+%s
+END_GROUP = L1_METADATA_FILE
+END
+"""
+
+
+def create_scene(sensor, size, path):
+    """ Create a synthetic scene of size x size pixel bands in path, returning filenames """
+    info = SENSORS[sensor]
+    basename = '%s_%s' % (sensor, size)
+    filenames = []
+    for band in info['bands']:
+        fname = os.path.join(path, '%s_%s.%s' % (basename, band, info['extension']))
+        # always GeoTIFF, GDAL identifies the format from contents rather than extension
+        geoimg = GeoImage.create(fname, size, size, 1, dtype='uint16', format='GTiff')
+        geoimg[0].write(np.random.randint(1, 2 ** 14, size=(size, size)).astype('uint16'))
+        geoimg = None
+        filenames.append(fname)
+    if sensor == 'landsat8':
+        coefs = []
+        for n in range(1, 10):
+            coefs += ['  RADIANCE_MULT_BAND_%s = 1.0E-02' % n, '  RADIANCE_ADD_BAND_%s = -50.0' % n,
+                      '  REFLECTANCE_MULT_BAND_%s = 2.0E-05' % n, '  REFLECTANCE_ADD_BAND_%s = -0.1' % n]
+        with open(os.path.join(path, basename + '_MTL.txt'), 'w') as f:
+            f.write(MTL % '\n'.join(coefs))
+    return filenames
+
+
+def io_counters():
+    """ Get (bytes read, bytes written) by this process, or None if not available """
+    try:
+        with open('/proc/self/io') as f:
+            io = dict([line.split(': ') for line in f.read().splitlines()])
+        return int(io['rchar']), int(io['wchar'])
+    except (IOError, OSError):
+        return None
+
+
+def run_case(sensor, case, filenames, outpath):
+    """ Time one case (construct, create_from_directory, or a product name) """
+    cls = SENSORS[sensor]['class']
+    io = io_counters()
+    start = time.time()
+    if case == 'construct':
+        cls(filenames, outpath=outpath)
+    elif case == 'create_from_directory':
+        cls.create_from_directory(os.path.dirname(filenames[0]), outpath=outpath)
+    else:
+        scene = cls(filenames, outpath=outpath)
+        scene.process([case])
+    result = {
+        'time': time.time() - start,
+        # kilobytes on Linux
+        'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    io2 = io_counters()
+    if io is not None and io2 is not None:
+        result['bytes_read'] = io2[0] - io[0]
+        result['bytes_written'] = io2[1] - io[1]
+    return result
+
+
+def run(sizes, sensors=None, repeat=1):
+    """ Run benchmarks for each sensor and size, returning {name: result} """
+    sensors = sorted(SENSORS) if sensors is None else sensors
+    results = {}
+    path = tempfile.mkdtemp()
+    try:
+        for sensor in sensors:
+            for size in sizes:
+                inpath = os.path.join(path, 'in_%s_%s' % (sensor, size))
+                os.makedirs(inpath)
+                filenames = create_scene(sensor, size, inpath)
+                for case in ['construct', 'create_from_directory'] + SENSORS[sensor]['products']:
+                    name = '%s.%s.%s' % (sensor, size, case)
+                    for i in range(repeat):
+                        outpath = tempfile.mkdtemp(dir=path)
+                        # each case in a new process, so peak memory is for that case alone
+                        pool = Pool(1)
+                        result = pool.apply(run_case, (sensor, case, filenames, outpath))
+                        pool.close()
+                        pool.join()
+                        shutil.rmtree(outpath)
+                        # keep fastest of repeats
+                        if name not in results or result['time'] < results[name]['time']:
+                            results[name] = result
+    finally:
+        shutil.rmtree(path)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ Get list of regressions, where time or memory exceed baseline by more than tolerance """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for key in ['time', 'maxrss']:
+            if results[name][key] > baseline[name][key] * (1 + tolerance):
+                regressions.append('%s %s: %s (baseline %s)' % (name, key, results[name][key], baseline[name][key]))
+    return regressions
+
+
+def save(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)
@@ -0,0 +1,148 @@
+"""
+    Persistent cache of product files, keyed by the inputs and parameters used to create them
+"""
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+from xml.etree import ElementTree
+from gippy import GeoImage
+from .version import __version__
+
+
+def vrt_fingerprint(filename, func):
+    """ Identify a VRT by its contents (without the directories of the files it references) and
+        by func(filename) of each file it references """
+    tree = ElementTree.parse(filename)
+    sources = []
+    for el in tree.iter('SourceFilename'):
+        source = el.text
+        if el.get('relativeToVRT') == '1':
+            source = os.path.join(os.path.dirname(filename), source)
+        if source not in sources:
+            sources.append(source)
+        el.text = os.path.basename(source)
+    return {
+        'name': os.path.basename(filename),
+        'sha1': hashlib.sha1(ElementTree.tostring(tree.getroot())).hexdigest(),
+        'sources': [func(s) for s in sources],
+    }
+
+
+def fingerprint(filename, checksum=False):
+    """ Identify a file by name, size and modification time (or checksum of contents). The directory
+        is not included, so copies of a file (e.g., staged in scratch space) have the same fingerprint.
+        VRTs (e.g., of band files clipped to an AOI) are identified by the files they reference """
+    if os.path.splitext(filename)[1].lower() == '.vrt':
+        return vrt_fingerprint(filename, lambda f: fingerprint(f, checksum=checksum))
+    st = os.stat(filename)
+    fp = {'name': os.path.basename(filename), 'size': st.st_size}
+    if checksum:
+        sha = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(2 ** 20), b''):
+                sha.update(block)
+        fp['sha1'] = sha.hexdigest()
+    else:
+        fp['mtime'] = st.st_mtime
+    return fp
+
+
+def link(src, dst):
+    """ Hard link src to dst, falling back to a copy across filesystems """
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return dst
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+class ProductCache(object):
+    """ A directory of product files named by a hash of the product inputs, class,
+        parameters and library version. Least recently used entries are evicted
+        when the cache grows larger than maxsize bytes. """
+
+    def __init__(self, path, maxsize=None, checksum=False):
+        self.path = path
+        self.maxsize = maxsize
+        # identify inputs by checksum rather than size and modification time
+        self.checksum = checksum
+        # {(filename, size, mtime): fingerprint} of inputs, so each is only fingerprinted once
+        self.fingerprints = {}
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def fingerprint(self, filename):
+        """ Get fingerprint of an input file, computed again only if the file changes """
+        if os.path.splitext(filename)[1].lower() == '.vrt':
+            return vrt_fingerprint(filename, self.fingerprint)
+        st = os.stat(filename)
+        key = (os.path.abspath(filename), st.st_size, st.st_mtime)
+        if key not in self.fingerprints:
+            self.fingerprints[key] = fingerprint(filename, checksum=self.checksum)
+        return self.fingerprints[key]
+
+    def key(self, product):
+        """ Get cache key for a product """
+        cls = product.__class__
+        inputs = [self.fingerprint(f) for f in product.scene.inputs()]
+        desc = {
+            'inputs': inputs,
+            'product': '%s.%s' % (cls.__module__, cls.__name__),
+            # e.g., of Index products, which may share a class name with different expressions
+            'expression': getattr(product, 'expression', None),
+            'dependencies': product.dependencies,
+            'params': product.params,
+            'version': __version__,
+        }
+        return hashlib.sha1(json.dumps(desc, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def entry(self, key):
+        """ Get filename of cache entry, or None if not cached """
+        fnames = glob.glob(os.path.join(self.path, key + '.*'))
+        return fnames[0] if len(fnames) > 0 else None
+
+    def open(self, product):
+        """ Open cached product as a GeoImage, linked to the product filename, or return None """
+        fname = self.entry(self.key(product))
+        if fname is None:
+            return None
+        # mark as recently used
+        os.utime(fname, None)
+        target = link(fname, product.filename + os.path.splitext(fname)[1])
+        return GeoImage.open([target])
+
+    def store(self, product, geoimg):
+        """ Add the (closed) product file of geoimg to the cache """
+        fname = geoimg.filename()
+        link(fname, os.path.join(self.path, self.key(product) + os.path.splitext(fname)[1]))
+        self.evict()
+
+    def entries(self):
+        """ Get list of (filename, size, last used) of all cache entries """
+        entries = []
+        for f in os.listdir(self.path):
+            st = os.stat(os.path.join(self.path, f))
+            entries.append((os.path.join(self.path, f), st.st_size, st.st_mtime))
+        return entries
+
+    def size(self):
+        """ Total size of cache in bytes """
+        return sum([e[1] for e in self.entries()])
+
+    def evict(self):
+        """ Remove least recently used entries until cache is no larger than maxsize """
+        if self.maxsize is None:
+            return
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum([e[1] for e in entries])
+        while total > self.maxsize and len(entries) > 0:
+            fname, size, _ = entries.pop(0)
+            os.remove(fname)
+            total -= size
@@ -0,0 +1,64 @@
+"""
+    Fast scanning of directory trees of scene files, with an optional persistent index
+"""
+
+import os
+import sqlite3
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+
+def walk(path):
+    """ Generate (directory, [filenames]) for path and all its subdirectories """
+    stack = [path]
+    while len(stack) > 0:
+        d = stack.pop()
+        files = []
+        subdirs = []
+        for entry in scandir(d):
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            else:
+                files.append(entry.name)
+        yield d, files
+        stack.extend(sorted(subdirs, reverse=True))
+
+
+class Catalog(object):
+    """ SQLite index of directory listings. Directories not modified since they
+        were last scanned are listed from the index rather than the filesystem """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS entries (dir TEXT, name TEXT, isdir INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS entries_dir ON entries (dir)')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def listdir(self, path):
+        """ Get list of (name, isdir) entries in path, from the index if path is unchanged """
+        mtime = os.stat(path).st_mtime
+        row = self.db.execute('SELECT mtime FROM dirs WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == mtime:
+            return [(n, bool(i)) for n, i in self.db.execute('SELECT name, isdir FROM entries WHERE dir = ?', (path,))]
+        entries = [(e.name, e.is_dir()) for e in scandir(path)]
+        with self.db:
+            self.db.execute('DELETE FROM entries WHERE dir = ?', (path,))
+            self.db.executemany('INSERT INTO entries VALUES (?, ?, ?)', [(path, n, int(i)) for n, i in entries])
+            self.db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)', (path, mtime))
+        return entries
+
+    def walk(self, path):
+        """ Generate (directory, [filenames]) for path and all its subdirectories """
+        stack = [path]
+        while len(stack) > 0:
+            d = stack.pop()
+            entries = self.listdir(d)
+            yield d, [n for n, isdir in entries if not isdir]
+            stack.extend(sorted([os.path.join(d, n) for n, isdir in entries if isdir], reverse=True))
@@ -0,0 +1,67 @@
+"""
+    Cloud-Optimized GeoTIFF (COG) output: tiled, compressed, with internal overviews
+"""
+
+import os
+from .errors import SatProcessError
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+
+DEFAULTS = {
+    'compress': 'DEFLATE',
+    # None chooses horizontal differencing for integers, floating point predictor for floats
+    'predictor': None,
+    'blocksize': 512,
+    'overviews': True,
+    'resampling': 'AVERAGE',
+}
+
+
+def options(cog):
+    """ Get COG options from True or a dictionary overriding the defaults """
+    opts = dict(DEFAULTS)
+    if isinstance(cog, dict):
+        unknown = set(cog) - set(DEFAULTS)
+        if len(unknown) > 0:
+            raise SatProcessError('unknown COG options: %s' % ' '.join(sorted(unknown)))
+        opts.update(cog)
+    return opts
+
+
+def creation_options(opts, dtype):
+    """ GDAL creation options for the COG driver """
+    predictor = opts['predictor']
+    if predictor is None:
+        predictor = 3 if 'float' in dtype.lower() else 2
+    copts = [
+        'COMPRESS=%s' % opts['compress'].upper(),
+        'BLOCKSIZE=%s' % opts['blocksize'],
+        'OVERVIEW_RESAMPLING=%s' % opts['resampling'].upper(),
+        'OVERVIEWS=%s' % ('AUTO' if opts['overviews'] else 'NONE'),
+        'BIGTIFF=IF_SAFER',
+    ]
+    if opts['compress'].upper() != 'NONE':
+        copts.append('PREDICTOR=%s' % predictor)
+    return copts
+
+
+def write(filename, cog=True, dtype='float32'):
+    """ Rewrite raster filename in place as a COG, options given by cog (True or dictionary).
+        This reads and writes the whole file again after it is generated """
+    if gdal is None:
+        raise SatProcessError('GDAL Python bindings (osgeo) required for COG output')
+    if gdal.GetDriverByName('COG') is None:
+        raise SatProcessError('GDAL >= 3.1 required for COG output')
+    opts = options(cog)
+    base, ext = os.path.splitext(filename)
+    tmpname = base + '_cog' + ext
+    # tiles, compression and overviews are all generated by the driver in one copy
+    ds = gdal.Translate(tmpname, filename, format='COG', creationOptions=creation_options(opts, dtype))
+    if ds is None:
+        raise SatProcessError('failed writing COG %s' % filename)
+    ds = None
+    os.rename(tmpname, filename)
+    return filename
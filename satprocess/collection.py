@@ -0,0 +1,103 @@
+"""
+    Collections of scenes covering the same footprint, with per-pixel temporal reductions of products
+"""
+
+import os
+import math
+import numpy as np
+from gippy import GeoImage
+from .errors import SatProcessError
+from .product import Product, NODATA
+from .instrument import span, count
+from . import reductions
+from . import cog as _cog
+from . import virtual as _virtual
+
+
+def aligned(geoimg1, geoimg2):
+    """ Check GeoImages are on the same pixel grid: same size, projection and geotransform
+        (to within a thousandth of a pixel) """
+    if (geoimg1.xsize(), geoimg1.ysize()) != (geoimg2.xsize(), geoimg2.ysize()):
+        return False
+    if geoimg1.srs() != geoimg2.srs():
+        return False
+    gt1, gt2 = list(geoimg1.geotransform()), list(geoimg2.geotransform())
+    tolerance = 1e-3 * abs(gt1[1])
+    return all([abs(a - b) <= tolerance for a, b in zip(gt1, gt2)])
+
+
+class SceneCollection(object):
+    """ Scenes covering the same footprint (the same pixel grid) at different times, e.g., a
+        year of Landsat8 scenes of one path/row. Reductions are computed one block at a time,
+        reading that block of every scene, so memory depends on the block size and not the
+        number of scenes """
+
+    # maximum accumulator values (pixels times depth of the reduction) per block
+    tilesize = 2 ** 22
+
+    def __init__(self, scenes, basename='collection', outpath='./'):
+        self.scenes = list(scenes)
+        if len(self.scenes) == 0:
+            raise SatProcessError('collection has no scenes')
+        # identifier for this collection, and directory to store outputs
+        self.basename = basename
+        self.outpath = outpath
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def __iter__(self):
+        return iter(self.scenes)
+
+    @classmethod
+    def group(cls, scenes, key, **kwargs):
+        """ Group scenes into collections by key(scene) (e.g., path/row from the scene basename),
+            returning {key: SceneCollection} """
+        groups = {}
+        for scene in scenes:
+            groups.setdefault(key(scene), []).append(scene)
+        return {k: cls(s, basename=str(k), **kwargs) for k, s in groups.items()}
+
+    def reduce(self, product, reduction='max', band=None, filename=None, q=None, bounds=(-1.0, 1.0), bins=256,
+               **kwargs):
+        """ Reduce a band (default: the first) of product over all scenes, per pixel, returning a
+            GeoImage. reduction is one of satprocess.reductions.REDUCTIONS: count (of valid pixels, so
+            clear observations if processed with masked=True), max, min, mean, median or percentile q.
+            Median and percentile use a histogram of each pixel with bins between bounds.
+            Other keywords are passed to each scene's product, and with cog the output is also
+            a Cloud-Optimized GeoTIFF """
+        if reduction == 'percentile' and q is None:
+            raise SatProcessError('percentile reduction requires q')
+        opts = {'q': q, 'bounds': bounds, 'bins': bins}
+        geoimgs = [scene[product].run(**kwargs) for scene in self.scenes]
+        band = geoimgs[0].bandnames()[0] if band is None else band
+        for scene, geoimg in zip(self.scenes, geoimgs):
+            if not aligned(geoimg, geoimgs[0]):
+                raise SatProcessError('%s %s is not on the same pixel grid as other scenes' % (scene.basename, product))
+            if not geoimg.bands_exist([band]):
+                raise SatProcessError('%s %s has no %s band' % (scene.basename, product, band))
+        name = reduction if reduction != 'percentile' else 'p%g' % q
+        if filename is None:
+            filename = os.path.join(self.outpath, '%s_%s_%s' % (self.basename, product, name))
+        depth = reductions.reduction(reduction, (1, 1), **opts).depth
+        numchunks = int(math.ceil(float(geoimgs[0].xsize()) * geoimgs[0].ysize() * depth / self.tilesize))
+        imgout = GeoImage.create_from(_virtual.base(geoimgs[0]), filename, 1, 'float32')
+        imgout.set_bandnames(['%s_%s' % (band, name)])
+        imgout.set_nodata(NODATA)
+        with span('reduce', product=product, reduction=name):
+            for chunk in geoimgs[0].chunks(numchunks=max(numchunks, 1)):
+                acc = None
+                for geoimg in geoimgs:
+                    arrs, valid = Product.read(geoimg, [band], chunk)
+                    if acc is None:
+                        acc = reductions.reduction(reduction, valid.shape, **opts)
+                    acc.update(arrs[band], valid & np.isfinite(arrs[band]))
+                out = acc.result()
+                out[~np.isfinite(out)] = NODATA
+                imgout[0].write(out, chunk)
+        count('pixels', imgout.xsize() * imgout.ysize() * len(geoimgs), product=product, reduction=name)
+        fname = imgout.filename()
+        imgout = None
+        if kwargs.get('cog'):
+            _cog.write(fname, kwargs['cog'])
+        return GeoImage.open([fname])
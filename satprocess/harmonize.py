@@ -0,0 +1,56 @@
+"""
+    Harmonization of bands at different resolutions onto one grid, resampled block by block when read
+"""
+
+from gippy import Chunk
+from . import resample
+from .virtual import VirtualImage, read, combine, files
+
+
+class HarmonizedImage(VirtualImage):
+    """ Bands of GeoImages at different resolutions (sharing an origin, such as the bands of a
+        Sentinel-2 tile) on the grid of the target GeoImage. Each block is read from the window of
+        each source covering it and interpolated, with grids cached for each geometry so they are
+        computed once for all scenes with the same footprint """
+
+    def __init__(self, target, geoimgs):
+        # {bandname: source GeoImage}, from the first GeoImage with the band
+        self.sources = {}
+        for geoimg in [target] + list(geoimgs):
+            for b in geoimg.bandnames():
+                self.sources.setdefault(b, geoimg)
+        bandnames = [b for g in [target] + list(geoimgs) for b in g.bandnames() if self.sources[b] is g]
+        super(HarmonizedImage, self).__init__(target, {}, bandnames=bandnames)
+
+    def files(self):
+        """ Get set of files held open by all sources """
+        return set().union(*[files(g) for g in self.sources.values()])
+
+    def source(self, band):
+        """ Get (GeoImage, func) that band is read from """
+        return self.sources[band], None
+
+    def read_band(self, band, chunk):
+        """ Read chunk of band resampled to the target grid, along with mask of valid pixels """
+        geoimg = self.sources[band]
+        xscale = abs(self.geoimg.resolution().x() / geoimg.resolution().x())
+        yscale = abs(self.geoimg.resolution().y() / geoimg.resolution().y())
+        if xscale == 1 and yscale == 1:
+            arrs, valid = read(geoimg, [band], chunk)
+            return arrs[band], valid
+        x0, y0, width, height = chunk.x0(), chunk.y0(), chunk.width(), chunk.height()
+        sx0, swidth = resample.source_window(x0, width, xscale, geoimg.xsize())
+        sy0, sheight = resample.source_window(y0, height, yscale, geoimg.ysize())
+        arrs, valid = read(geoimg, [band], Chunk(sx0, sy0, swidth, sheight))
+        rows = resample.cached_grid(y0, height, yscale, sy0, sheight)
+        cols = resample.cached_grid(x0, width, xscale, sx0, swidth)
+        return resample.bilinear(arrs[band], rows, cols), resample.nearest(valid, rows, cols)
+
+    def read(self, bands, chunk, masks=False):
+        """ Read chunk of bands as {band: float32 array}, along with mask of valid pixels
+            (or {band: mask} if masks) """
+        arrs = {}
+        valid = {}
+        for b in bands:
+            arrs[b], valid[b] = self.read_band(b, chunk)
+        return arrs, (valid if masks else combine(valid, bands))
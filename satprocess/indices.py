@@ -0,0 +1,61 @@
+"""
+    Spectral indices defined as band-math expressions of generic band names
+"""
+
+import numpy as np
+from .errors import SatProcessError
+
+
+# index name: expression
+INDICES = {
+    'ndvi': '(nir - red) / (nir + red)',
+    'evi': '2.5 * (nir - red) / (nir + 6.0 * red - 7.5 * blue + 1.0)',
+    'ndwi': '(green - nir) / (green + nir)',
+    'nbr': '(nir - swir2) / (nir + swir2)',
+    'savi': '1.5 * (nir - red) / (nir + red + 0.5)',
+}
+
+# functions available in expressions
+FUNCTIONS = {f: getattr(np, f) for f in ['abs', 'sqrt', 'exp', 'log', 'minimum', 'maximum', 'where']}
+
+
+def compile_expression(expression):
+    """ Compile expression, returning code and list of band names used """
+    try:
+        code = compile(expression, '<%s>' % expression, 'eval')
+    except SyntaxError as e:
+        raise SatProcessError('invalid expression %s: %s' % (expression, e))
+    for name in code.co_names:
+        if name.startswith('_'):
+            raise SatProcessError('invalid name %s in expression %s' % (name, expression))
+    return code, [n for n in code.co_names if n not in FUNCTIONS]
+
+
+def bands(expression):
+    """ Get band names used in expression """
+    return compile_expression(expression)[1]
+
+
+def function(expression):
+    """ Get function evaluating expression with {band: array}, compiling it once """
+    code, names = compile_expression(expression)
+
+    def func(arrs):
+        missing = [n for n in names if n not in arrs]
+        if len(missing) > 0:
+            raise SatProcessError('expression %s requires bands: %s' % (expression, ' '.join(missing)))
+        env = dict(FUNCTIONS)
+        env.update({n: arrs[n] for n in names})
+        return eval(code, {'__builtins__': {}}, env)
+    return func
+
+
+def evaluate(expression, arrs):
+    """ Evaluate expression with {band: array} """
+    return function(expression)(arrs)
+
+
+def register(name, expression):
+    """ Add an index so it can be used by all scenes """
+    bands(expression)
+    INDICES[name] = expression
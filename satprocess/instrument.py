@@ -0,0 +1,177 @@
+"""
+    Instrumentation of processing with timing spans and counters, sent to pluggable sinks.
+    With no sinks enabled (the default) spans and counters do nothing.
+"""
+
+import json
+import time
+import logging
+import cProfile
+
+
+logger = logging.getLogger(__name__)
+
+# enabled sinks
+_sinks = []
+
+
+class Span(object):
+    """ A timed operation (e.g., processing a product) with tags identifying it """
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.time()
+        for s in _sinks:
+            s.start(self)
+        return self
+
+    def __exit__(self, *args):
+        self.duration = time.time() - self.start
+        for s in reversed(_sinks):
+            s.finish(self)
+
+
+class _NoSpan(object):
+    """ Span used when instrumentation is disabled """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NOSPAN = _NoSpan()
+
+
+def span(name, **tags):
+    """ Get context manager timing an operation """
+    if len(_sinks) == 0:
+        return NOSPAN
+    return Span(name, tags)
+
+
+def count(name, value, **tags):
+    """ Increment a counter (e.g., pixels processed) """
+    for s in _sinks:
+        s.count(name, value, tags)
+
+
+def enable(*sinks):
+    """ Send spans and counters to these sinks """
+    _sinks.extend(sinks)
+
+
+def disable():
+    """ Disable all sinks """
+    del _sinks[:]
+
+
+def _key(name, tags):
+    return (name, tuple(sorted(tags.items())))
+
+
+class Sink(object):
+    """ Base sink, which ignores everything """
+
+    def start(self, span):
+        pass
+
+    def finish(self, span):
+        pass
+
+    def count(self, name, value, tags):
+        pass
+
+
+class LogSink(Sink):
+    """ Log spans and counters as JSON """
+
+    def __init__(self, logger=logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def finish(self, span):
+        self.logger.log(self.level, json.dumps({'span': span.name, 'duration': span.duration, 'tags': span.tags}))
+
+    def count(self, name, value, tags):
+        self.logger.log(self.level, json.dumps({'counter': name, 'value': value, 'tags': tags}))
+
+
+class PrometheusSink(Sink):
+    """ Accumulate span durations and counters, written in Prometheus text format """
+
+    def __init__(self, prefix='satprocess'):
+        self.prefix = prefix
+        self.durations = {}
+        self.spans = {}
+        self.counters = {}
+
+    def finish(self, span):
+        key = _key(span.name, span.tags)
+        self.durations[key] = self.durations.get(key, 0.0) + span.duration
+        self.spans[key] = self.spans.get(key, 0) + 1
+
+    def count(self, name, value, tags):
+        key = _key(name, tags)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    @staticmethod
+    def _labels(tags, **extra):
+        labels = list(tags) + sorted(extra.items())
+        return '{%s}' % ','.join(['%s="%s"' % (k, v) for k, v in labels])
+
+    def text(self):
+        """ Get metrics in Prometheus text exposition format """
+        lines = ['# TYPE %s_span_seconds_total counter' % self.prefix]
+        for (name, tags), val in sorted(self.durations.items()):
+            lines.append('%s_span_seconds_total%s %s' % (self.prefix, self._labels(tags, span=name), val))
+        lines.append('# TYPE %s_span_total counter' % self.prefix)
+        for (name, tags), val in sorted(self.spans.items()):
+            lines.append('%s_span_total%s %s' % (self.prefix, self._labels(tags, span=name), val))
+        # one TYPE line per counter, followed by all of its tag sets
+        last = None
+        for (name, tags), val in sorted(self.counters.items()):
+            if name != last:
+                lines.append('# TYPE %s_%s_total counter' % (self.prefix, name))
+                last = name
+            lines.append('%s_%s_total%s %s' % (self.prefix, name, self._labels(tags), val))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.text())
+
+
+class ProfileSink(Sink):
+    """ Profile processing of one product with cProfile, saving stats to filename. This includes
+        processing of products fused with it (tagged with fused product names) """
+
+    def __init__(self, product, filename):
+        self.product = product
+        self.filename = filename
+        self.profile = cProfile.Profile()
+        self.depth = 0
+
+    def _match(self, span):
+        if span.name != 'process':
+            return False
+        return span.tags.get('product') == self.product or self.product in span.tags.get('fused', '').split()
+
+    def start(self, span):
+        if self._match(span):
+            if self.depth == 0:
+                self.profile.enable()
+            self.depth += 1
+
+    def finish(self, span):
+        if self._match(span):
+            self.depth -= 1
+            if self.depth == 0:
+                self.profile.disable()
+                self.profile.dump_stats(self.filename)
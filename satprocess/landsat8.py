@@ -1,19 +1,147 @@
+import os
+import math
+import logging
+import numpy as np
 from .scene import Scene
-from .product import Product, DigitalCounts,  TOA as _TOA, NDVI, EVI, Color
-from gippy import GeoImage
+from .product import Product, DigitalCounts,  TOA as _TOA, NDVI, EVI, NDWI, NBR, SAVI, Color
+from .errors import SatProcessError
+from gippy import GeoImage, Chunk
+from .instrument import span
+from . import resample
+from .virtual import VirtualImage, linear
+
+
+logger = logging.getLogger(__name__)
+
+
+def read_mtl(filename):
+    """ Read MTL metadata file into a flat dictionary of {KEY: value} """
+    md = {}
+    with open(filename) as f:
+        for line in f:
+            if '=' not in line:
+                continue
+            key, val = [v.strip() for v in line.split('=', 1)]
+            if key in ['GROUP', 'END_GROUP']:
+                continue
+            val = val.strip('"')
+            try:
+                val = float(val)
+            except ValueError:
+                pass
+            md[key] = val
+    return md
+
+
+class Calibration(object):
+    """ Radiometric calibration coefficients of each band from MTL metadata """
+
+    def __init__(self, metadata, bandmap):
+        self.metadata = metadata
+        # band number of each band name (e.g., {'red': '4'})
+        self.numbers = {name: b[1:] for b, name in bandmap.items()}
+        self.sun_elevation = metadata['SUN_ELEVATION']
+        self.earth_sun_distance = metadata['EARTH_SUN_DISTANCE']
+
+    @classmethod
+    def from_mtl(cls, filename, bandmap):
+        return cls(read_mtl(filename), bandmap)
+
+    def coefficients(self, band, kind):
+        """ Get (gain, offset) of band from metadata, kind is RADIANCE or REFLECTANCE """
+        number = self.numbers[band]
+        try:
+            return (self.metadata['%s_MULT_BAND_%s' % (kind, number)],
+                    self.metadata['%s_ADD_BAND_%s' % (kind, number)])
+        except KeyError:
+            raise SatProcessError('no %s coefficients for %s band' % (kind.lower(), band))
+
+    def radiance(self, band):
+        """ Get (gain, offset) to convert digital counts to radiance """
+        return self.coefficients(band, 'RADIANCE')
+
+    def reflectance(self, band):
+        """ Get (gain, offset) to convert digital counts to TOA reflectance, corrected for sun elevation.
+            Landsat 8 reflectance coefficients already account for the earth-sun distance """
+        gain, offset = self.coefficients(band, 'REFLECTANCE')
+        sun = math.sin(math.radians(self.sun_elevation))
+        return gain / sun, offset / sun
+
+
+def calibrate(bands, coefficients):
+    """ Get function that applies (gain, offset) coefficients in place to float32 blocks of bands """
+    def func(arrs):
+        outs = []
+        for b, (gain, offset) in zip(bands, coefficients):
+            arr = arrs[b]
+            arr *= gain
+            arr += offset
+            outs.append(arr)
+        return outs
+    return func
 
 
 class TOA(_TOA):
     """ Top of the Atmosphere reflectance """
 
+    def inputs(self):
+        """ Metadata file, for the calibration """
+        return [] if self.scene.metadata is None else [self.scene.metadata]
+
     def process(self, *args, **kwargs):
         """ Generate TOA from digital counts """
         super(TOA, self).process(*args, **kwargs)
-        # TODO - set radiance gain and offset from metadata file
         if self.geoimg is None:
             geoimgs = self.get_dependencies()
-            # convert from dc to reflectance
-            self.geoimg = geoimgs[0]
+            if self.scene.calibration is None:
+                logger.warning('%s: no metadata, using digital counts for TOA reflectance' % self.scene.basename)
+                self.geoimg = geoimgs[0]
+            else:
+                # convert from dc to reflectance
+                bands = list(geoimgs[0].bandnames())
+                coefs = [self.scene.calibration.reflectance(b) for b in bands]
+                if self.virtual:
+                    funcs = {b: linear(*c) for b, c in zip(bands, coefs)}
+                    self.geoimg = VirtualImage(geoimgs[0], funcs)
+                else:
+                    self.geoimg = self.stream(geoimgs[0], bands, calibrate(bands, coefs), bands)
+        return self.geoimg
+
+
+class Mask(Product):
+    """ Mask of pixels flagged in the quality (BQA) band, for use with masked=True """
+    name = 'mask'
+    description = 'Mask of fill, cloud, cloud shadow, cirrus and saturated pixels from quality band'
+
+    dependencies = {'quality': ['quality']}
+
+    # masked fields of the Collection 1 BQA bitfield as (first bit, number of bits, minimum value)
+    fields = {
+        'fill': (0, 1, 1),
+        'terrain': (1, 1, 1),
+        'saturation': (2, 2, 3),
+        'cloud': (4, 1, 1),
+        'cloud_shadow': (7, 2, 3),
+        'cirrus': (11, 2, 3),
+    }
+
+    @classmethod
+    def decode(cls, qa, fields=None):
+        """ Get boolean mask, True where any of fields (default: all) is flagged in quality array qa """
+        qa = qa.astype('uint16')
+        masked = np.zeros(qa.shape, dtype='bool')
+        for f in (cls.fields if fields is None else fields):
+            bit, nbits, minval = cls.fields[f]
+            masked |= ((qa >> bit) & ((1 << nbits) - 1)) >= minval
+        return masked
+
+    def process(self, masked=None, **kwargs):
+        """ Generate byte mask (1 masked, 0 clear) with 1 as nodata, so clear pixels are valid data """
+        super(Mask, self).process(**kwargs)
+        if self.geoimg is None:
+            geoimgs = self.get_dependencies()
+            self.geoimg = self.stream(geoimgs[0], ['quality'], lambda arrs: [self.decode(arrs['quality'])],
+                                      ['mask'], dtype='byte', nodata=1)
         return self.geoimg
 
 
@@ -22,6 +150,56 @@ class Pan(Product):
     description = 'High resolution panchromatic band'
 
 
+class Pansharpen(Product):
+    """ Pansharpened visible bands """
+    name = 'pansharpen'
+    description = 'Pansharpened (Brovey) visible bands at panchromatic resolution'
+
+    dependencies = {'pan': ['pan'], 'toa': ['red', 'green', 'blue']}
+
+    def process(self, **kwargs):
+        super(Pansharpen, self).process(**kwargs)
+        if self.geoimg is None:
+            geoimgs = dict(zip(self.dependencies, self.get_dependencies()))
+            self.geoimg = self.sharpen(geoimgs['pan'], geoimgs['toa'])
+        return self.geoimg
+
+    def sharpen(self, panimg, msimg):
+        """ Write pansharpened bands one pan chunk at a time, interpolating only the multispectral
+            window covering each chunk so the upsampled bands are never held in full """
+        bands = self.dependencies['toa']
+        xscale = abs(panimg.resolution().x() / msimg.resolution().x())
+        yscale = abs(panimg.resolution().y() / msimg.resolution().y())
+        # pan in the same units as the multispectral bands
+        gain, offset = (1.0, 0.0) if self.scene.calibration is None else self.scene.calibration.reflectance('pan')
+        maskimg = self.scene['mask'].run() if self.masked else None
+        imgout = self.create(panimg, bands)
+        with span('stream', product=self.name):
+            for chunk in self.chunks(panimg):
+                x0, y0, width, height = chunk.x0(), chunk.y0(), chunk.width(), chunk.height()
+                mx0, mwidth = resample.source_window(x0, width, xscale, msimg.xsize())
+                my0, mheight = resample.source_window(y0, height, yscale, msimg.ysize())
+                mschunk = Chunk(mx0, my0, mwidth, mheight)
+                arrs, valid = self.read(msimg, bands, mschunk)
+                if maskimg is not None:
+                    valid &= maskimg[0].data_mask(mschunk).astype('bool')
+                rows = resample.grid(y0, height, yscale, my0, mheight)
+                cols = resample.grid(x0, width, xscale, mx0, mwidth)
+                pan, panvalid = self.read(panimg, ['pan'], chunk)
+                pan = pan['pan'] * gain + offset
+                upsampled = [resample.bilinear(arrs[b], rows, cols) for b in bands]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ratio = pan * len(bands) / sum(upsampled)
+                    outs = [u * ratio for u in upsampled]
+                outs = self.mask(outs, panvalid & resample.nearest(valid, rows, cols))
+                for i, out in enumerate(outs):
+                    imgout[i].write(out, chunk)
+        fname = imgout.filename()
+        # close output to flush it
+        imgout = None
+        return self.finish(fname)
+
+
 class Radiance(Product):
     """ Apparent radiance """
     name = 'rad'
@@ -29,14 +207,27 @@ class Radiance(Product):
 
     dependencies = {'dc': []}
 
+    def inputs(self):
+        """ Metadata file, for the calibration """
+        return [] if self.scene.metadata is None else [self.scene.metadata]
+
     def process(self, *args, **kwargs):
-        """ Generate TOA from digital counts """
+        """ Generate radiance from digital counts """
         super(Radiance, self).process(*args, **kwargs)
-        # TODO - set radiance gain and offset from metadata file
         if self.geoimg is None:
             geoimgs = self.get_dependencies()
-            # convert from dc to radiance
-            self.geoimg = geoimgs[0]
+            if self.scene.calibration is None:
+                logger.warning('%s: no metadata, using digital counts for radiance' % self.scene.basename)
+                self.geoimg = geoimgs[0]
+            else:
+                # convert from dc to radiance
+                bands = list(geoimgs[0].bandnames())
+                coefs = [self.scene.calibration.radiance(b) for b in bands]
+                if self.virtual:
+                    funcs = {b: linear(*c) for b, c in zip(bands, coefs)}
+                    self.geoimg = VirtualImage(geoimgs[0], funcs)
+                else:
+                    self.geoimg = self.stream(geoimgs[0], bands, calibrate(bands, coefs), bands)
         return self.geoimg
 
 
@@ -45,12 +236,17 @@ class Landsat8Scene(Scene):
 
     _available_products = {
         'quality': DigitalCounts,
+        'mask': Mask,
         'dc': DigitalCounts,
         'pan': Pan,
+        'pansharpen': Pansharpen,
         'rad': Radiance,
         'toa': TOA,
         'ndvi': NDVI,
         'evi': EVI,
+        'ndwi': NDWI,
+        'nbr': NBR,
+        'savi': SAVI,
         'color': Color
     }
 
@@ -70,11 +266,23 @@ class Landsat8Scene(Scene):
 
     _pattern = r'(.*)_(B.*)\.(TIF|tif)'
 
-    def __init__(self, *args, **kwargs):
-        """ Open existing files as digital counts """
-        super(Landsat8Scene, self).__init__(*args, **kwargs)
+    def __init__(self, filenames, metadata=None, **kwargs):
+        """ Open existing files as digital counts, with calibration from MTL metadata file """
+        super(Landsat8Scene, self).__init__(filenames, **kwargs)
+        if metadata is None and len(filenames) > 0:
+            # look for MTL file alongside the band files
+            basename = self.parse_filename(filenames[0])[0]
+            metadata = os.path.join(os.path.dirname(filenames[0]), basename + '_MTL.txt')
+            metadata = metadata if os.path.exists(metadata) else None
+        self.metadata = metadata
+        self.calibration = None if metadata is None else Calibration.from_mtl(metadata, self._bandmap)
         # add pan product if present
         self.add_bands('pan', ['pan'])
         self.add_bands('quality', ['quality'])
         self.add_bands('dc', ['coastal', 'blue', 'green', 'red', 'nir', 'swir1', 'swir2', 'cirrus'])
 
+    def inputs(self):
+        """ All input files of the scene, including metadata """
+        inputs = super(Landsat8Scene, self).inputs()
+        return inputs if self.metadata is None else inputs + [self.metadata]
+
@@ -0,0 +1,67 @@
+"""
+    Per-scene manifest of products generated, so only products whose inputs or parameters
+    changed are rebuilt
+"""
+
+import os
+import json
+import hashlib
+from gippy import GeoImage
+from .cache import fingerprint
+from .version import __version__
+
+
+class Manifest(object):
+    """ A JSON file listing each product generated for a scene, with fingerprints of its inputs,
+        its parameters, and its output file. Each product's digest includes the digests of its
+        dependencies, so a change to any product makes all products depending on it stale """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.entries = json.load(f)
+
+    def describe(self, product):
+        """ Get description of product: class, parameters, inputs and dependencies """
+        cls = product.__class__
+        return {
+            'product': '%s.%s' % (cls.__module__, cls.__name__),
+            # e.g., of Index products, which may share a class name with different expressions
+            'expression': getattr(product, 'expression', None),
+            'params': getattr(product, 'params', {}),
+            'inputs': [fingerprint(f) for f in product.inputs()],
+            'dependencies': {d: [b, self.digest(product.scene[d])] for d, b in product.dependencies.items()},
+            'version': __version__,
+        }
+
+    def digest(self, product):
+        """ Get digest of product, from its description and those of its dependencies """
+        desc = json.dumps(self.describe(product), sort_keys=True)
+        return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+    def stale(self, product):
+        """ Check if product needs to be rebuilt """
+        entry = self.entries.get(product.name)
+        if entry is None or not os.path.exists(entry['filename']):
+            return True
+        return entry['digest'] != self.digest(product)
+
+    def open(self, product):
+        """ Open output of product if it is up to date, otherwise return None """
+        if self.stale(product):
+            return None
+        return GeoImage.open([self.entries[product.name]['filename']])
+
+    def record(self, product, filename):
+        """ Record output filename of product and save manifest """
+        entry = self.describe(product)
+        entry['digest'] = self.digest(product)
+        entry['filename'] = filename
+        self.entries[product.name] = entry
+        self.save()
+
+    def save(self):
+        with open(self.filename, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
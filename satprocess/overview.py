@@ -0,0 +1,79 @@
+"""
+    Decimated reads of whole bands, from overviews (or JPEG2000 resolution levels) where available,
+    for previews and statistics that do not need full resolution
+"""
+
+import os
+import numpy as np
+from .errors import SatProcessError
+from .virtual import VirtualImage, base
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+
+def shape(geoimg, size):
+    """ Get (xsize, ysize) of geoimg decimated so the larger side is no more than size pixels """
+    scale = min(float(size) / max(geoimg.xsize(), geoimg.ysize()), 1.0)
+    return max(int(round(geoimg.xsize() * scale)), 1), max(int(round(geoimg.ysize() * scale)), 1)
+
+
+def source(geoimg, band):
+    """ Get (filename, band number) of a band of a GeoImage """
+    bandnames = list(geoimg.bandnames())
+    filenames = geoimg.filenames()
+    i = bandnames.index(band)
+    return filenames[i], len([f for f in filenames[:i] if f == filenames[i]]) + 1
+
+
+def read(geoimg, band, xsize, ysize):
+    """ Read band of a GeoImage or VirtualImage decimated to xsize by ysize as a float32 array,
+        along with mask of valid pixels. GDAL reads from the closest overview """
+    if gdal is None:
+        raise SatProcessError('GDAL Python bindings (osgeo) required for decimated reads')
+    if isinstance(geoimg, VirtualImage):
+        src, func = geoimg.source(band)
+        arr, valid = read(src, band, xsize, ysize)
+        return (arr if func is None else func(arr)), valid
+    filename, number = source(geoimg, band)
+    ds = gdal.Open(filename)
+    if ds is None:
+        raise SatProcessError('unable to open %s' % filename)
+    rband = ds.GetRasterBand(number)
+    arr = rband.ReadAsArray(buf_xsize=xsize, buf_ysize=ysize).astype('float32')
+    nodata = rband.GetNoDataValue()
+    valid = np.ones(arr.shape, dtype='bool') if nodata is None else arr != nodata
+    ds = None
+    arr *= geoimg[band].gain()
+    arr += geoimg[band].offset()
+    return arr, valid
+
+
+def write(filename, arrs, geoimg, bandnames, nodata=0, dtype='byte'):
+    """ Write decimated arrays of geoimg as a GeoTIFF, georeferenced at the decimated resolution """
+    if gdal is None:
+        raise SatProcessError('GDAL Python bindings (osgeo) required for decimated outputs')
+    geoimg = base(geoimg)
+    ds = gdal.Open(geoimg.filenames()[0])
+    ysize, xsize = arrs[0].shape
+    # scale pixel size by the decimation of columns and rows
+    xscale = float(geoimg.xsize()) / xsize
+    yscale = float(geoimg.ysize()) / ysize
+    gt = list(ds.GetGeoTransform())
+    gt[1], gt[4] = gt[1] * xscale, gt[4] * xscale
+    gt[2], gt[5] = gt[2] * yscale, gt[5] * yscale
+    if os.path.splitext(filename)[1] == '':
+        filename = filename + '.tif'
+    gdtype = gdal.GetDataTypeByName('Byte' if dtype == 'byte' else dtype.capitalize())
+    out = gdal.GetDriverByName('GTiff').Create(filename, xsize, ysize, len(arrs), gdtype)
+    out.SetGeoTransform(gt)
+    out.SetProjection(ds.GetProjection())
+    for i, (arr, name) in enumerate(zip(arrs, bandnames)):
+        rband = out.GetRasterBand(i + 1)
+        rband.SetDescription(name)
+        rband.SetNoDataValue(nodata)
+        rband.WriteArray(arr)
+    out = None
+    ds = None
+    return filename
@@ -0,0 +1,143 @@
+"""
+    Prefetching of input files for upcoming items (e.g., scenes) in a background thread,
+    overlapping reads from slow or remote storage with processing
+"""
+
+import os
+import shutil
+import logging
+import threading
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+
+def listdir(path):
+    """ Default files of an item: all files in directory path """
+    return sorted([os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))])
+
+
+class Prefetcher(object):
+    """ Stage the files of items ahead of their use, either by reading them (warming the page
+        cache) or by copying them to a local scratch directory. At most depth items are staged
+        ahead of the consumer, and staging waits while items not yet released exceed budget
+        bytes, unless the consumer is waiting (so the consumer never blocks on the budget).
+        Items that fail to stage are given to the consumer unstaged, so errors (e.g., a missing
+        directory) are those of using the item directly """
+
+    def __init__(self, files=listdir, depth=2, budget=2 ** 30, scratch=None, opener=open, blocksize=2 ** 20):
+        # function mapping an item to its list of filenames
+        self.files = files
+        self.depth = depth
+        self.budget = budget
+        self.scratch = scratch
+        self.opener = opener
+        self.blocksize = blocksize
+        self.cond = threading.Condition()
+        # {item: (staged path, bytes)} of staged items not yet released
+        self.staged = {}
+        self.nbytes = 0
+        # number of items staged but not yet taken by the consumer
+        self.ahead = 0
+
+    def _stage_file(self, filename, dest=None):
+        """ Read file in blocks, writing to dest if given """
+        fout = None if dest is None else open(dest, 'wb')
+        try:
+            with self.opener(filename, 'rb') as f:
+                for block in iter(lambda: f.read(self.blocksize), b''):
+                    if fout is not None:
+                        fout.write(block)
+        finally:
+            if fout is not None:
+                fout.close()
+
+    def _stage(self, item, filenames):
+        """ Stage files of item, returning the path to use for it """
+        if self.scratch is None:
+            for f in filenames:
+                self._stage_file(f)
+            return item
+        path = tempfile.mkdtemp(dir=self.scratch)
+        try:
+            for f in filenames:
+                dest = os.path.join(path, os.path.basename(f))
+                self._stage_file(f, dest)
+                # keep modification times, so copies are identified as the same inputs
+                shutil.copystat(f, dest)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        return path
+
+    def _room(self, size):
+        return self.ahead == 0 or (self.ahead < self.depth and self.nbytes + size <= self.budget)
+
+    def stage(self, items):
+        """ Generate (item, staged path) for items in order, as they are staged. Call
+            release(item) once an item is no longer needed to make room for more """
+        results = []
+        done = []
+
+        def produce():
+            try:
+                for item in items:
+                    try:
+                        filenames = self.files(item)
+                        size = sum([os.path.getsize(f) for f in filenames])
+                    except Exception as e:
+                        logger.warning('unable to stage %s: %s' % (item, e))
+                        filenames, size = None, 0
+                    with self.cond:
+                        while not self._room(size):
+                            self.cond.wait()
+                        # reserve space before staging, so the budget holds while copying
+                        self.staged[item] = (None, size)
+                        self.nbytes += size
+                        self.ahead += 1
+                    path = item
+                    if filenames is not None:
+                        try:
+                            path = self._stage(item, filenames)
+                        except Exception as e:
+                            logger.warning('unable to stage %s: %s' % (item, e))
+                    with self.cond:
+                        self.staged[item] = (path, size)
+                        results.append((item, path))
+                        self.cond.notify_all()
+            except Exception as e:
+                with self.cond:
+                    results.append(e)
+                    self.cond.notify_all()
+            finally:
+                with self.cond:
+                    done.append(True)
+                    self.cond.notify_all()
+
+        thread = threading.Thread(target=produce)
+        thread.daemon = True
+        thread.start()
+        while True:
+            with self.cond:
+                while len(results) == 0 and len(done) == 0:
+                    self.cond.wait()
+                if len(results) == 0:
+                    break
+                result = results.pop(0)
+                if not isinstance(result, Exception):
+                    self.ahead -= 1
+                    self.cond.notify_all()
+            if isinstance(result, Exception):
+                raise result
+            yield result
+        thread.join()
+
+    def release(self, item):
+        """ Release a staged item, removing any scratch copy """
+        with self.cond:
+            path, size = self.staged.pop(item)
+            self.nbytes -= size
+            self.cond.notify_all()
+        if self.scratch is not None and path is not None and path != item:
+            shutil.rmtree(path, ignore_errors=True)
@@ -3,9 +3,23 @@
 """
 
 import os
-from gippy import GeoImage
-from gippy.algorithms import indices
+import math
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from gippy import GeoImage, Chunk
 from errors import SatProcessError
+from .instrument import span, count
+from . import cog as _cog
+from . import indices
+from . import virtual as _virtual
+from . import overview
+from .statistics import Stats, samplesize
+
+
+# nodata value of floating point products
+NODATA = -32768
 
 
 class Product(object):
@@ -19,13 +33,55 @@ class Product(object):
     # dependencies in the form {product: [bands]}
     dependencies = {}
 
+    # maximum number of pixels in a block when streaming, bounds memory use
+    tilesize = 2 ** 22
+
+    # number of threads processing blocks concurrently
+    workers = 1
+
+    # write outputs as Cloud-Optimized GeoTIFFs (True or a dictionary of satprocess.cog options)
+    cog = False
+
+    # exclude pixels flagged by the scene's mask product, skipping chunks that are fully masked
+    masked = False
+
+    # products that support it return a satprocess.virtual.VirtualImage computed when read, instead of a file
+    virtual = False
+
     def __init__(self, scene):
         """ Initialize a product with a Scene, which contains other products """
         # products don't exist on their own, they are owned by a parent Scene
         self.scene = scene
-        # start with no GeoImage
+        # copy dependencies so they can be changed per instance (e.g., Color bands)
+        self.dependencies = {d: list(b) for d, b in self.dependencies.items()}
+        # files to open the first time the GeoImage is used, {bandname: filename}
+        self.sources = {}
+        # bands read from this product by others (empty if none noted yet, None if all)
+        self.required = set()
+        # {(band, options): satprocess.statistics.Stats} of the GeoImage
+        self.stats = {}
+        # start with no GeoImage (or output file)
         self.geoimg = None
 
+    @property
+    def geoimg(self):
+        """ GeoImage of this product, opening any source files the first time it is used, or
+            reopening the output file if released """
+        if self._geoimg is None and self.output is not None:
+            self._geoimg = GeoImage.open([self.output])
+        elif self._geoimg is None and len(self.sources) > 0:
+            # only the bands required by other products, if any were noted
+            bands = [b for b in self.sources if not self.required or b in self.required]
+            self.open(filenames=[self.sources[b] for b in bands], bandnames=bands)
+        return self._geoimg
+
+    @geoimg.setter
+    def geoimg(self, geoimg):
+        """ Set GeoImage, or forget it (and any output file) with None """
+        self._geoimg = geoimg
+        if geoimg is None:
+            self.output = None
+
     def open(self, filenames=None, bandnames=None, **kwargs):
         """ Open series of files {bandname: filename} as a product """
         if filenames is None:
@@ -33,29 +89,273 @@ class Product(object):
             filenames = self.scene.filenames.values()
             bandnames = self.scene.filenames.keys()
         if len(filenames) > 0:
-            self.geoimg = GeoImage.open(filenames, bandnames=bandnames, **kwargs)
+            with span('open', product=self.name):
+                self.geoimg = GeoImage.open(filenames, bandnames=bandnames, **kwargs)
         return self.geoimg
 
+    def require(self, bands):
+        """ Note bands read from this product by another (all of them if bands is empty), so products
+            opened from sources open only required bands, and virtual products only require those bands
+            of their dependencies. A GeoImage missing newly required bands is released, so it is
+            reopened (or regenerated) with them """
+        if self.required is None:
+            return
+        if len(self.sources) > 0:
+            bands = [b for b in bands if b in self.sources]
+        required = None if len(bands) == 0 else self.required | set(bands)
+        if required == self.required:
+            return
+        self.required = required
+        if self._geoimg is None or (len(self.sources) == 0 and self.output is not None):
+            return
+        if required is None:
+            # all bands, for products from sources only if some were not opened
+            stale = len(self.sources) == 0 or self._geoimg.nbands() < len(self.sources)
+        else:
+            stale = not self._geoimg.bands_exist(sorted(required))
+        if stale:
+            self.release()
+
     def get_dependencies(self):
         geoimgs = []
         for d in self.dependencies:
-            geoimg = self.scene[d].process()
+            bands = self.dependencies[d]
+            if len(bands) == 0 and self.virtual and self.required:
+                # a virtual product reads only the bands read from it
+                bands = sorted(self.required)
+            self.scene[d].require(bands)
+            with span('dependency', product=self.name, dependency=d):
+                geoimg = self.scene[d].run()
             # check required bands present
             if not geoimg.bands_exist(self.dependencies[d]):
                 raise SatProcessError('%s requires bands: %s' % (self.name, ' '.join(self.dependencies[d])))
             geoimgs.append(geoimg)
         return geoimgs
 
-    def process(self, filename=None, **kwargs):
-        """ Check if already exists or process and return GeoImage """
+    def run(self, *args, **kwargs):
+        """ Process product, instrumented with a span """
+        with span('process', product=self.name):
+            geoimg = self.process(*args, **kwargs)
+        self.scene.touch(self)
+        return geoimg
+
+    def process(self, filename=None, tilesize=None, workers=None, cog=None, masked=None, virtual=None, **kwargs):
+        """ Check if already exists or process and return GeoImage. Outputs are written
+            as Cloud-Optimized GeoTIFFs if cog is True or a dictionary of COG options """
         self.filename = self.get_filename() if filename is None else filename
+        if tilesize is not None:
+            self.tilesize = tilesize
+        if workers is not None:
+            self.workers = workers
+        if cog is not None:
+            self.cog = cog
+        if masked is not None:
+            self.masked = masked
+        if virtual is not None:
+            self.virtual = virtual
+        # parameters which, along with the inputs, determine the output
+        self.params = kwargs
+        if self.cog:
+            self.params['cog'] = self.cog
+        if self.masked:
+            self.params['masked'] = True
+        if len(self.dependencies) > 0 and self.scene.manifest is not None and self.geoimg is None:
+            self.geoimg = self.scene.manifest.open(self)
+        if len(self.dependencies) > 0 and self.scene.cache is not None and self.geoimg is None:
+            self.geoimg = self.scene.cache.open(self)
+        if self._geoimg is not None and self.output is None and len(self.dependencies) > 0:
+            # opened from the manifest or cache
+            self.output = self._geoimg.filename()
         # get and return dependencies
         return self.geoimg
 
+    def reset(self):
+        """ Restore processing options (tilesize, workers, cog, masked, virtual) to the class defaults,
+            and release the GeoImage if generated from dependencies, so it is processed again (or
+            reopened, if up to date in the manifest or cache) with the options of the next run """
+        for attr in ['tilesize', 'workers', 'cog', 'masked', 'virtual']:
+            self.__dict__.pop(attr, None)
+        if len(self.dependencies) > 0:
+            self.release()
+            self.output = None
+
+    def set_virtual(self, virtual):
+        """ Set the virtual option, releasing a virtual GeoImage if no longer virtual so it is
+            not returned in place of a generated product """
+        self.virtual = virtual
+        if not virtual and isinstance(self._geoimg, _virtual.VirtualImage):
+            self.release()
+
+    def inputs(self):
+        """ Input files read directly by this product (not through dependencies) """
+        return sorted(self.sources.values())
+
+    def release(self):
+        """ Release the GeoImage, closing its files, if it can be reopened (from the output file or
+            sources) or regenerated from dependencies """
+        if len(self.dependencies) > 0 or len(self.sources) > 0:
+            self._geoimg = None
+            self.stats = {}
+            self.scene.held.pop(self.name, None)
+
     def get_filename(self):
         """ Return an appropriate output filename for this product """
         return os.path.join(self.scene.outpath, self.scene.basename + '_%s' % self.name)
 
+    def chunks(self, geoimg):
+        """ Get chunks (windows) of geoimg with no more than tilesize pixels each """
+        numchunks = int(math.ceil(float(geoimg.xsize()) * geoimg.ysize() / self.tilesize))
+        return geoimg.chunks(numchunks=max(numchunks, 1))
+
+    @staticmethod
+    def read(geoimg, bands, chunk, masks=False):
+        """ Read chunk of bands as {band: float32 array}, along with mask of valid pixels
+            (or {band: mask} if masks) """
+        return _virtual.read(geoimg, bands, chunk, masks=masks)
+
+    def map(self, geoimg, bands, func, chunks=None, masked=None, masks=False):
+        """ Generate (chunk, func(arrs, valid)) for each chunk of bands in geoimg (default: all
+            of them), computed by a pool of worker threads. Reads are serialized since GDAL
+            datasets are not thread safe, while computation (which releases the GIL) runs
+            concurrently. If masked (default: the product's masked), chunks with no clear
+            pixels are not read and arrs is None, with valid the (empty) clear mask. With
+            masks, valid is {band: mask} of each band """
+        lock = threading.Lock()
+        masked = self.masked if masked is None else masked
+        maskimg = self.scene['mask'].run() if masked else None
+
+        def work(chunk):
+            with lock:
+                if maskimg is not None:
+                    # the mask product has the mask value as nodata
+                    clear = maskimg[0].data_mask(chunk).astype('bool')
+                    if not clear.any():
+                        return chunk, func(None, clear)
+                arrs, valid = self.read(geoimg, bands, chunk, masks=masks)
+            if maskimg is not None:
+                for mask in (valid.values() if masks else [valid]):
+                    mask &= clear
+            return chunk, func(arrs, valid)
+
+        chunks = self.chunks(geoimg) if chunks is None else chunks
+        if self.workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield work(chunk)
+            return
+        pool = ThreadPool(min(self.workers, len(chunks)))
+        # limit chunks in flight so memory stays bounded if results are consumed slowly
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append(pool.apply_async(work, (chunk,)))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().get()
+            while len(pending) > 0:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def statistics(self, bands=None, error=None, bounds=None, bins=1000, masked=None, size=None):
+        """ Get {band: satprocess.statistics.Stats} of valid pixels, cached on the product so they are
+            computed once. With error, stats are from a sample of rows and columns sized so percentiles
+            are within error (as a fraction of ranks), otherwise from one pass over all pixels, with a
+            histogram of bins between bounds (for percentiles) if given. With size, stats are of all
+            pixels of bands decimated to size (read from overviews where available, and not masked) """
+        self.require([] if bands is None else bands)
+        geoimg = self.run() if self.geoimg is None else self.geoimg
+        bands = list(geoimg.bandnames()) if bands is None else bands
+        masked = self.masked if masked is None else masked
+        key = (error, None if bounds is None else tuple(bounds), bins, masked, size)
+        todo = [b for b in bands if (b, key) not in self.stats]
+        if len(todo) > 0 and size is not None:
+            xsize, ysize = overview.shape(geoimg, size)
+            with span('statistics', product=self.name):
+                for b in todo:
+                    arr, valid = overview.read(geoimg, b, xsize, ysize)
+                    stats = Stats(bounds=bounds, bins=bins, sampled=True)
+                    self.stats[(b, key)] = stats.update(arr[valid & np.isfinite(arr)])
+        elif len(todo) > 0:
+            sampled = error is not None
+            chunks = None
+            colstep = 1
+            if sampled:
+                step = max(geoimg.xsize() * geoimg.ysize() // samplesize(error), 1)
+                rowstep = max(int(math.sqrt(step)), 1)
+                colstep = max(step // rowstep, 1)
+                chunks = [Chunk(0, y, geoimg.xsize(), 1) for y in range(rowstep // 2, geoimg.ysize(), rowstep)]
+
+            def compute(arrs, valid):
+                stats = {b: Stats(bounds=bounds, bins=bins, sampled=sampled) for b in todo}
+                if arrs is not None:
+                    for b in todo:
+                        stats[b].update(arrs[b][valid & np.isfinite(arrs[b])][::colstep])
+                return stats
+
+            stats = {b: Stats(bounds=bounds, bins=bins, sampled=sampled) for b in todo}
+            with span('statistics', product=self.name):
+                for chunk, s in self.map(geoimg, todo, compute, chunks=chunks, masked=masked):
+                    for b in todo:
+                        stats[b].merge(s[b])
+            self.stats.update({(b, key): stats[b] for b in todo})
+        return {b: self.stats[(b, key)] for b in bands}
+
+    def create(self, geoimg, bandnames, dtype='float32', nodata=NODATA):
+        """ Create output file for this product with same size as geoimg """
+        imgout = GeoImage.create_from(_virtual.base(geoimg), self.filename, len(bandnames), dtype)
+        imgout.set_bandnames(bandnames)
+        imgout.set_nodata(nodata)
+        return imgout
+
+    @staticmethod
+    def mask(outs, valid, dtype='float32', nodata=NODATA, nbands=1):
+        """ Set invalid pixels of output arrays to nodata and convert to dtype.
+            If outs is None returns nbands arrays of nodata """
+        npdtype = np.dtype('uint8' if dtype == 'byte' else dtype)
+        if outs is None:
+            return [np.full(valid.shape, nodata, dtype=npdtype) for i in range(nbands)]
+        for out in outs:
+            out[~(valid & np.isfinite(out))] = nodata
+        return [out.astype(npdtype) for out in outs]
+
+    def finish(self, fname, dtype='float32'):
+        """ Reopen completed output fname. Callers must release all references to the output
+            GeoImage first, closing it so it is flushed to disk """
+        with span('save', product=self.name):
+            if self.cog:
+                _cog.write(fname, self.cog, dtype=dtype)
+            imgout = GeoImage.open([fname])
+        # reopened from here if released
+        self.output = fname
+        count('pixels', imgout.xsize() * imgout.ysize() * imgout.nbands(), product=self.name)
+        count('bytes_written', os.path.getsize(fname), product=self.name)
+        if self.scene.cache is not None:
+            self.scene.cache.store(self, imgout)
+        if self.scene.manifest is not None:
+            self.scene.manifest.record(self, fname)
+        return imgout
+
+    def stream(self, geoimg, bands, func, bandnames, dtype='float32', nodata=NODATA):
+        """ Write output one chunk at a time, func maps {band: array} to a list of output arrays """
+        imgout = self.create(geoimg, bandnames, dtype=dtype, nodata=nodata)
+
+        def compute(arrs, valid):
+            if arrs is None:
+                return self.mask(None, valid, dtype=dtype, nodata=nodata, nbands=len(bandnames))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                outs = func(arrs)
+            return self.mask(outs, valid, dtype=dtype, nodata=nodata)
+
+        with span('stream', product=self.name):
+            # outputs are written from this thread only
+            for chunk, outs in self.map(geoimg, bands, compute):
+                for i, out in enumerate(outs):
+                    imgout[i].write(out, chunk)
+        fname = imgout.filename()
+        # close output to flush it
+        imgout = None
+        return self.finish(fname, dtype=dtype)
+
 
 class DigitalCounts(Product):
     name = 'dc'
@@ -79,32 +379,86 @@ class TOA(Product):
         return self.geoimg
 
 
-class NDVI(Product):
-    name = 'ndvi'
-    description = 'Normalized Difference Vegetation Index (NDVI) from TOA reflectance'
+class Index(Product):
+    """ A spectral index calculated from an expression of bands (see satprocess.indices) """
+    name = 'index'
+    description = 'Spectral index'
 
-    dependencies = {'toa': ['nir', 'red']}
+    expression = None
 
     def process(self, **kwargs):
-        super(NDVI, self).process(**kwargs)
+        super(Index, self).process(**kwargs)
         if self.geoimg is None:
-            geoimgs = self.get_dependencies()
-            self.geoimg = indices(geoimgs[0], ['ndvi'], filename=self.filename)
+            self.fuse([self])
         return self.geoimg
 
+    @staticmethod
+    def fuse(products):
+        """ Calculate Index products with the same dependency in one pass, reading each band once.
+            Products must have been initialized with Product.process first """
+        products = [p for p in products if p.geoimg is None]
+        if len(products) == 0:
+            return
+        if len(set([list(p.dependencies)[0] for p in products])) > 1:
+            raise SatProcessError('fused indices must all depend on the same product')
+        dependency = products[0].scene[list(products[0].dependencies)[0]]
+        bands = sorted(set(sum([list(p.dependencies.values())[0] for p in products], [])))
+        # require the bands of all products first, so the dependency is opened once with all of them
+        dependency.require(bands)
+        # the dependency is only read, so is processed as a virtual product if possible
+        virtual = dependency.virtual
+        dependency.virtual = True
+        try:
+            geoimg = products[0].get_dependencies()[0]
+            for p in products[1:]:
+                p.get_dependencies()
+            imgouts = [p.create(geoimg, [p.name]) for p in products]
+            funcs = [indices.function(p.expression) for p in products]
 
-class EVI(Product):
-    name = 'evi'
-    description = 'Enhanced Vegetation Index'
+            def compute(arrs, masks):
+                if arrs is None:
+                    return Product.mask(None, masks, nbands=len(products))
+                outs = []
+                for p, func in zip(products, funcs):
+                    # valid pixels of each index are those of its own bands, as if calculated alone
+                    valid = _virtual.combine(masks, list(p.dependencies.values())[0])
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        outs.extend(Product.mask([func(arrs).astype('float32')], valid))
+                return outs
 
-    dependencies = {'toa': ['nir', 'red', 'blue']}
+            with span('stream', product=products[0].name, fused=' '.join([p.name for p in products])):
+                for chunk, outs in products[0].map(geoimg, bands, compute, masks=True):
+                    for imgout, out in zip(imgouts, outs):
+                        imgout[0].write(out, chunk)
+            fnames = [imgout.filename() for imgout in imgouts]
+            # close outputs to flush them
+            imgout = None
+            imgouts = None
+            for p, fname in zip(products, fnames):
+                p.geoimg = p.finish(fname)
+        finally:
+            dependency.set_virtual(virtual)
 
-    def process(self, **kwargs):
-        super(EVI, self).process(**kwargs)
-        if self.geoimg is None:
-            geoimgs = self.get_dependencies()
-            self.geoimg = indices(geoimgs[0], ['evi'], filename=self.filename)
-        return self.geoimg
+
+def index_product(name, expression=None, description=None, product='toa'):
+    """ Create an Index product class from an expression (default from satprocess.indices.INDICES) """
+    expression = indices.INDICES[name] if expression is None else expression
+    if description is None:
+        description = '%s index (%s) from %s' % (name.upper(), expression, product)
+    attrs = {
+        'name': name,
+        'description': description,
+        'expression': expression,
+        'dependencies': {product: indices.bands(expression)},
+    }
+    return type(str(name.upper()), (Index,), attrs)
+
+
+NDVI = index_product('ndvi', description='Normalized Difference Vegetation Index (NDVI) from TOA reflectance')
+EVI = index_product('evi', description='Enhanced Vegetation Index')
+NDWI = index_product('ndwi', description='Normalized Difference Water Index')
+NBR = index_product('nbr', description='Normalized Burn Ratio')
+SAVI = index_product('savi', description='Soil Adjusted Vegetation Index')
 
 
 class Color(Product):
@@ -113,12 +467,82 @@ class Color(Product):
 
     dependencies = {'toa': []}
 
-    def process(self, bands=['red', 'green', 'blue'], sd_stretch=2.0, **kwargs):
-        """ Color does not retain the geoimg, since it could be different """
-        super(Color, self).process(**kwargs)
+    # stretch percentiles are sampled to within this fraction of ranks (with 95% confidence)
+    error = 0.002
+
+    def process(self, bands=['red', 'green', 'blue'], sd_stretch=2.0, filename=None, size=None, **kwargs):
+        """ Color does not retain the geoimg, since it could be different. With size, a thumbnail
+            no larger than size pixels is made from decimated reads, never reading full resolution """
         # dependent on these bands
-        self.dependencies[self.dependencies.keys()[0]] = bands
-        geoimgs = self.get_dependencies()
-        self.filename = self.filename + ''.join([c[0] for c in bands])
-        # should nodata be explicitly set to 0 here?
-        return geoimgs[0].select(bands).autoscale(1, 255, percent=sd_stretch).save(self.filename, dtype='byte')
+        self.dependencies[list(self.dependencies)[0]] = bands
+        if filename is None:
+            filename = self.get_filename() + ''.join([c[0] for c in bands])
+            if size is not None:
+                filename = filename + '_%s' % size
+        if size is not None:
+            kwargs['size'] = size
+        self.geoimg = None
+        geoimg = super(Color, self).process(filename=filename, bands=bands, sd_stretch=sd_stretch, **kwargs)
+        self.geoimg = None
+        if geoimg is not None:
+            return geoimg
+        if size is not None:
+            return self.thumbnail(bands, sd_stretch, size)
+        # the dependency is only read, so is processed as a virtual product if possible
+        dependency = self.scene[list(self.dependencies)[0]]
+        virtual = dependency.virtual
+        dependency.virtual = True
+        try:
+            geoimgs = self.get_dependencies()
+            # first pass gets the stretch, second pass scales to 1-255, with 0 as nodata
+            limits = self.stretch(bands, sd_stretch)
+
+            def scale(arrs):
+                return [np.clip(1 + 254 * (arrs[b] - lo) / (hi - lo), 1, 255) for b, (lo, hi) in zip(bands, limits)]
+
+            return self.stream(geoimgs[0], bands, scale, bands, dtype='byte', nodata=0)
+        finally:
+            dependency.set_virtual(virtual)
+
+    def thumbnail(self, bands, percent, size):
+        """ Write thumbnail from bands of the dependency decimated to size, with the stretch from
+            the same decimated bands. The dependency is processed as a virtual product if possible """
+        dependency = self.scene[list(self.dependencies)[0]]
+        dependency.require(bands)
+        virtual = dependency.virtual
+        geoimg = dependency.run(virtual=True)
+        try:
+            if not geoimg.bands_exist(bands):
+                raise SatProcessError('%s requires bands: %s' % (self.name, ' '.join(bands)))
+            limits = self.stretch(bands, percent, size=size)
+            xsize, ysize = overview.shape(geoimg, size)
+            with span('thumbnail', product=self.name):
+                outs = []
+                valid = None
+                for b, (lo, hi) in zip(bands, limits):
+                    arr, mask = overview.read(geoimg, b, xsize, ysize)
+                    outs.append(np.clip(1 + 254 * (arr - lo) / (hi - lo), 1, 255))
+                    valid = mask if valid is None else valid & mask
+                outs = self.mask(outs, valid, dtype='byte', nodata=0)
+                fname = overview.write(self.filename, outs, geoimg, bands, nodata=0)
+                if self.cog:
+                    _cog.write(fname, self.cog, dtype='byte')
+        finally:
+            dependency.set_virtual(virtual)
+        return GeoImage.open([fname])
+
+    def stretch(self, bands, percent, size=None):
+        """ Get (low, high) percent clip limits of each band from sampled (or decimated, with size)
+            statistics of the dependency """
+        dependency = self.scene[list(self.dependencies)[0]]
+        if size is None:
+            stats = dependency.statistics(bands, error=self.error, masked=self.masked)
+        else:
+            stats = dependency.statistics(bands, size=size)
+        limits = []
+        for b in bands:
+            if stats[b].count == 0:
+                raise SatProcessError('%s band has no valid pixels' % b)
+            lo, hi = stats[b].percentile([percent, 100.0 - percent])
+            limits.append((lo, hi if hi > lo else lo + 1))
+        return limits
@@ -0,0 +1,135 @@
+"""
+    Per-pixel reductions over a series of arrays (e.g., the same block of many scenes), updated
+    one array at a time so memory does not depend on the length of the series
+"""
+
+import numpy as np
+from .errors import SatProcessError
+
+
+class Reduction(object):
+    """ Reduction of valid pixels of arrays of shape, NaN where no pixel was valid """
+
+    # accumulator values per pixel, so blocks can be sized to bound memory
+    depth = 1
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.count = np.zeros(shape, dtype='uint32')
+
+    def update(self, arr, valid):
+        self.count += valid
+
+    def result(self):
+        return self.count.astype('float32')
+
+
+class Count(Reduction):
+    """ Number of valid (e.g., clear) observations """
+
+
+class Max(Reduction):
+
+    def __init__(self, shape):
+        super(Max, self).__init__(shape)
+        self.value = np.full(shape, -np.inf, dtype='float32')
+
+    def update(self, arr, valid):
+        super(Max, self).update(arr, valid)
+        np.maximum(self.value, np.where(valid, arr, -np.inf), out=self.value)
+
+    def result(self):
+        return np.where(self.count > 0, self.value, np.nan).astype('float32')
+
+
+class Min(Max):
+
+    def update(self, arr, valid):
+        Reduction.update(self, arr, valid)
+        np.maximum(self.value, np.where(valid, -arr, -np.inf), out=self.value)
+
+    def result(self):
+        return -super(Min, self).result()
+
+
+class Mean(Reduction):
+
+    def __init__(self, shape):
+        super(Mean, self).__init__(shape)
+        self.total = np.zeros(shape, dtype='float64')
+
+    def update(self, arr, valid):
+        super(Mean, self).update(arr, valid)
+        self.total += np.where(valid, arr, 0)
+
+    def result(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > 0, self.total / self.count, np.nan).astype('float32')
+
+
+class Percentile(Reduction):
+    """ Percentile q from a histogram of each pixel with bins between bounds (lo, hi), with values
+        outside the bounds counted in the end bins. Results are accurate to about the bin width """
+
+    def __init__(self, shape, q=50.0, bounds=(-1.0, 1.0), bins=256):
+        super(Percentile, self).__init__(shape)
+        self.q = q
+        self.lo, hi = bounds
+        self.width = float(hi - self.lo) / bins
+        self.bins = bins
+        self.hist = np.zeros((bins,) + tuple(shape), dtype='uint32')
+
+    @property
+    def depth(self):
+        return self.bins + 1
+
+    def update(self, arr, valid):
+        super(Percentile, self).update(arr, valid)
+        index = np.clip(np.floor((arr[valid] - self.lo) / self.width), 0, self.bins - 1).astype('int')
+        hist = self.hist.reshape(self.bins, -1)
+        np.add.at(hist, (index, np.flatnonzero(valid)), 1)
+
+    def order(self, k):
+        """ Get k-th (from 0) smallest value of each pixel, assuming values are spread evenly within bins """
+        hist = self.hist.reshape(self.bins, -1)
+        cum = np.cumsum(hist, axis=0)
+        index = np.minimum((cum <= k).sum(axis=0), self.bins - 1)
+        pixels = np.arange(hist.shape[1])
+        below = np.where(index > 0, cum[np.maximum(index - 1, 0), pixels], 0)
+        inbin = np.maximum(hist[index, pixels], 1)
+        return self.lo + (index + (k - below + 0.5) / inbin) * self.width
+
+    def result(self):
+        count = self.count.ravel()
+        # same interpolation between ranks as numpy.percentile
+        rank = self.q / 100.0 * np.maximum(count.astype('float64') - 1, 0)
+        k = np.floor(rank)
+        frac = rank - k
+        value = self.order(k) * (1 - frac) + self.order(np.minimum(k + 1, np.maximum(count, 1) - 1)) * frac
+        return np.where(count > 0, value, np.nan).reshape(self.shape).astype('float32')
+
+
+class Median(Percentile):
+
+    def __init__(self, shape, **kwargs):
+        kwargs['q'] = 50.0
+        super(Median, self).__init__(shape, **kwargs)
+
+
+REDUCTIONS = {
+    'count': Count,
+    'max': Max,
+    'min': Min,
+    'mean': Mean,
+    'median': Median,
+    'percentile': Percentile,
+}
+
+
+def reduction(name, shape, **kwargs):
+    """ Create a reduction by name, with keywords (q, bounds, bins) for median and percentile """
+    if name not in REDUCTIONS:
+        raise SatProcessError('unknown reduction %s, use one of: %s' % (name, ' '.join(sorted(REDUCTIONS))))
+    if not issubclass(REDUCTIONS[name], Percentile):
+        kwargs = {}
+    return REDUCTIONS[name](shape, **kwargs)
@@ -0,0 +1,65 @@
+"""
+    Block-wise resampling of arrays between grids sharing an origin but with different resolutions
+"""
+
+import math
+import threading
+import numpy as np
+
+
+# maximum number of cached grids, enough for every block of a few tile geometries
+MAXGRIDS = 4096
+
+# {(start, size, scale, srcstart, srcsize): grid}, shared by all scenes with the same geometry
+_grids = {}
+_lock = threading.Lock()
+
+
+def source_window(start, size, scale, srcsize):
+    """ Get (first, count) of source pixels needed to interpolate target pixels [start, start + size),
+        where scale is source pixels per target pixel """
+    first = max(int(math.floor((start + 0.5) * scale - 0.5)), 0)
+    last = min(int(math.ceil((start + size - 0.5) * scale - 0.5)), srcsize - 1)
+    return first, max(last - first + 1, 1)
+
+
+def grid(start, size, scale, srcstart, srcsize):
+    """ Get bilinear interpolation indices (i0, i1) and weights of i1 along one axis, for target
+        pixels [start, start + size) from source pixels [srcstart, srcstart + srcsize) """
+    coords = (np.arange(start, start + size) + 0.5) * scale - 0.5 - srcstart
+    coords = np.clip(coords, 0, srcsize - 1)
+    i0 = np.floor(coords).astype('int')
+    i1 = np.minimum(i0 + 1, srcsize - 1)
+    return i0, i1, (coords - i0).astype('float32')
+
+
+def cached_grid(start, size, scale, srcstart, srcsize):
+    """ Get grid, computed once for each geometry. Grids are read-only, as they are shared """
+    key = (start, size, round(scale, 12), srcstart, srcsize)
+    with _lock:
+        g = _grids.get(key)
+    if g is None:
+        g = grid(start, size, scale, srcstart, srcsize)
+        for arr in g:
+            arr.flags.writeable = False
+        with _lock:
+            if len(_grids) >= MAXGRIDS:
+                _grids.clear()
+            _grids[key] = g
+    return g
+
+
+def bilinear(arr, rows, cols):
+    """ Interpolate 2D array with row and column grids """
+    r0, r1, wr = rows
+    c0, c1, wc = cols
+    wr = wr[:, np.newaxis]
+    tmp = arr[r0] * (1 - wr) + arr[r1] * wr
+    return tmp[:, c0] * (1 - wc) + tmp[:, c1] * wc
+
+
+def nearest(arr, rows, cols):
+    """ Nearest neighbor of 2D array with row and column grids """
+    r = np.where(rows[2] < 0.5, rows[0], rows[1])
+    c = np.where(cols[2] < 0.5, cols[0], cols[1])
+    return arr[r[:, np.newaxis], c]
@@ -1,7 +1,13 @@
 import os
 import re
+from collections import OrderedDict
 import satprocess.product as p
 from errors import SatProcessError
+from .catalog import walk
+from .manifest import Manifest
+from .instrument import span
+from . import aoi as _aoi
+from . import virtual as _virtual
 
 
 class Scene(object):
@@ -14,6 +20,9 @@ class Scene(object):
         p.TOA.name: p.TOA,
         p.NDVI.name: p.NDVI,
         p.EVI.name: p.EVI,
+        p.NDWI.name: p.NDWI,
+        p.NBR.name: p.NBR,
+        p.SAVI.name: p.SAVI,
         p.Color.name: p.Color,
     }
 
@@ -28,35 +37,102 @@ class Scene(object):
         """ Lowercase string of class name """
         return cls.__name__.lower()
 
-    def __init__(self, filenames, bandnames=None, basename=None, outpath='./', **kwargs):
+    @classmethod
+    def regex(cls):
+        """ Compiled _pattern, compiled once for each class """
+        if cls.__dict__.get('_regex') is None:
+            cls._regex = re.compile(cls._pattern)
+        return cls._regex
+
+    def __init__(self, filenames, bandnames=None, basename=None, outpath='./', cache=None, manifest=False,
+                 maxfiles=None, aoi=None, **kwargs):
         """ Create a scene instance with list of products and filenames """
         # identifier for this scene
         self.basename = self.classname() if basename is None else basename
         # directory to store output products
         self.outpath = outpath
-        # a collection of product class instances
-        self.__products__ = {n: p(self) for n, p in self._available_products.items()}
         if bandnames is None:
             bandnames = [self.parse_filename(f)[1] for f in filenames]
+        # area of interest, a bounding box (minx, miny, maxx, maxy) in scene coordinates or GeoJSON geometry
+        self.aoi = aoi
+        if aoi is not None:
+            # all products are from band files clipped to the AOI, so are named for it
+            self.basename = '%s_%s' % (self.basename, _aoi.key(aoi))
+            filenames = _aoi.clip(filenames, aoi, os.path.join(outpath, self.basename + '_aoi'))
+        # a satprocess.cache.ProductCache for reusing products already generated
+        self.cache = cache
+        # a satprocess.manifest.Manifest of products generated in outpath, so only stale products are rebuilt
+        self.manifest = Manifest(os.path.join(outpath, self.basename + '_manifest.json')) if manifest else None
+        # number of files product GeoImages may hold open, least recently used products are released
+        #  beyond this. This bounds open datasets, not memory, which is mostly GDAL's block cache
+        #  (set with GDAL_CACHEMAX), since GeoImages only read blocks as needed
+        self.maxfiles = maxfiles
+        # {product: set of files} of products holding a GeoImage, least recently used first
+        self.held = OrderedDict()
+        # a collection of product class instances
+        self.__products__ = {n: p(self) for n, p in self._available_products.items()}
         self.filenames = dict(zip(bandnames, filenames))
         # the Scene does not open anything - use specific sensor Scene, or
         #  call Scene[product].open() to seed a product with filenames given here
 
     @classmethod
-    def create_from_directory(cls, path):
+    def create_from_directory(cls, path, **kwargs):
         """ Create a Scene object from files found in a directory """
         if not os.path.isdir(path):
             raise SatProcessError("directory %s does not exist" % path)
         # match the pattern
-        filenames = [os.path.join(path, d) for d in os.listdir(path) if re.match(cls._pattern, d)]
-        return cls(filenames)
+        regex = cls.regex()
+        filenames = [os.path.join(path, d) for d in os.listdir(path) if regex.match(d)]
+        if len(filenames) == 0:
+            raise SatProcessError("no files matching %s found in %s" % (cls._pattern, path))
+        # name outputs after the scene rather than the sensor
+        if 'basename' not in kwargs:
+            kwargs['basename'] = cls.parse_filename(filenames[0])[0]
+        return cls(filenames, **kwargs)
+
+    @classmethod
+    def scan(cls, path, catalog=None, **kwargs):
+        """ Generate Scenes from all files in path and its subdirectories, grouped by basename.
+            A satprocess.catalog.Catalog makes repeated scans of unchanged directories faster """
+        if not os.path.isdir(path):
+            raise SatProcessError("directory %s does not exist" % path)
+        regex = cls.regex()
+        for d, files in (walk(path) if catalog is None else catalog.walk(path)):
+            scenes = {}
+            for f in files:
+                m = regex.match(f)
+                if m:
+                    scenes.setdefault(m.group(1), []).append((f, m.group(2)))
+            for basename in sorted(scenes):
+                filenames = [os.path.join(d, f) for f, _ in scenes[basename]]
+                bandnames = [cls._bandmap.get(b, b) for _, b in scenes[basename]]
+                yield cls(filenames, bandnames=bandnames, basename=basename, **kwargs)
+
+    @classmethod
+    def add_product_parser(cls, parser):
+        """ Add product selection arguments to an argparse parser """
+        group = parser.add_argument_group('products')
+        group.add_argument('-p', '--products', help='Products to generate', nargs='*', default=[],
+                           choices=sorted(cls._available_products.keys()))
+        group.add_argument('--cog', help='Write products as Cloud-Optimized GeoTIFFs', default=False,
+                           action='store_true')
+        if 'mask' in cls._available_products:
+            group.add_argument('--masked', help='Exclude pixels flagged by the mask product', default=False,
+                               action='store_true')
+        return group
 
     def __getattr__(self, attr):
         """ Get processed products as attributes (e.g., scene.ndvi()) """
         if attr not in self.__products__:
             raise SatProcessError("%s product not available in %s" % (attr, self.classname()))
         else:
-            return self.__products__[attr].process
+            product = self.__products__[attr]
+
+            def run(*args, **kwargs):
+                # all bands of a product used directly are required
+                product.require([])
+                return product.run(*args, **kwargs)
+            return run
 
     def __getitem__(self, key):
         """ Return GeoImage for this product """
@@ -65,23 +141,134 @@ class Scene(object):
             raise SatProcessError("%s product not available in %s" % (key, self.classname()))
         return self.__products__[key]
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Release the GeoImages of all products, closing their files """
+        for product in self.__products__.values():
+            product.geoimg = None
+        self.held.clear()
+
+    def touch(self, product):
+        """ Mark product as most recently used, releasing least recently used products (which are
+            reopened, or regenerated if virtual) while they hold more than maxfiles files open """
+        self.held.pop(product.name, None)
+        if product.geoimg is None:
+            return
+        self.held[product.name] = _virtual.files(product.geoimg)
+        if self.maxfiles is None:
+            return
+        for name in list(self.held):
+            if len(set().union(*self.held.values())) <= self.maxfiles:
+                break
+            if name != product.name:
+                self[name].release()
+
+    def reset(self, products=None):
+        """ Reset products (default: all) and their dependencies to default options, so products
+            already generated are not returned when processed with different options """
+        for name in self.plan(list(self.__products__) if products is None else products):
+            self[name].reset()
+
+    def inputs(self):
+        """ All input files of the scene """
+        return sorted(self.filenames.values())
+
     def available_products(self):
         """ Get list of available products and descriptions """
         # TODO - take into account bands, and what bands available in input products, etc
         return {k: self.__products__[k].description for k in self.__products__.keys()}
 
+    def plan(self, products):
+        """ Get all products required to generate products, in the order they are to be processed """
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise SatProcessError("circular dependency on %s product" % name)
+            visiting.add(name)
+            for d in self[name].dependencies:
+                visit(d)
+            visiting.remove(name)
+            order.append(name)
+
+        for name in products:
+            visit(name)
+        return order
+
+    def process(self, products, **kwargs):
+        """ Process a list of products, returning dictionary of {product: GeoImage}
+
+            Shared dependencies are processed once, and intermediate products not
+            requested are processed only when a product needing them is generated
+            (not when it is up to date in the manifest or cache), as virtual products
+            where supported so they are computed in the same pass without writing files,
+            and released once all products that depend on them are done. Keywords
+            (e.g., cog, tilesize, workers) are passed to every product """
+        order = self.plan(products)
+        # number of products still to be processed that depend on each product
+        consumers = {n: len([m for m in order if n in self[m].dependencies]) for n in order}
+        geoimgs = {}
+        fused = set()
+
+        def done(name):
+            for d in self[name].dependencies:
+                consumers[d] -= 1
+                if consumers[d] == 0 and d not in products:
+                    self[d].release()
+                    done(d)
+
+        # set options of intermediate products, which are then processed only if needed (products from
+        #  sources are not opened here, so they open only the bands then required of them)
+        virtual = {}
+        for name in order:
+            if name not in products and len(self[name].dependencies) > 0:
+                virtual[name] = self[name].virtual
+                p.Product.process(self[name], virtual=True, **kwargs)
+        for name in products:
+            self[name].require([])
+        try:
+            for name in order:
+                if name not in products:
+                    continue
+                if isinstance(self[name], p.Index) and name not in fused:
+                    # calculate all requested indices from the same product in a single pass
+                    dep = list(self[name].dependencies)[0]
+                    group = [n for n in products if isinstance(self[n], p.Index) and dep in self[n].dependencies]
+                    for n in group:
+                        p.Product.process(self[n], **kwargs)
+                    with span('process', product=name, fused=' '.join(group)):
+                        p.Index.fuse([self[n] for n in group])
+                    fused.update(group)
+                geoimgs[name] = self[name].run(**kwargs)
+                done(name)
+        finally:
+            # intermediates are only virtual within this call
+            for name, v in virtual.items():
+                self[name].set_virtual(v)
+        return geoimgs
+
+    def add_index(self, name, expression=None, product='toa'):
+        """ Add an Index product from an expression of band names, or from satprocess.indices """
+        self.__products__[name] = p.index_product(name, expression=expression, product=product)(self)
+
     def add_bands(self, product, bands):
-        """ Add bands given in self.filenames to product """
+        """ Add bands given in self.filenames to product, opened when the product is first used. Only
+            the bands required by the products using it are opened (see Product.require) """
         fnames = {f: self.filenames[f] for f in self.filenames if f in bands}
-        #import nose.tools; nose.tools.set_trace()
-        if len(fnames) > 0:
-            self[product].open(filenames=fnames.values(), bandnames=fnames.keys())
+        self[product].sources.update(fnames)
 
     @classmethod
     def parse_filename(cls, filename):
         """ Split out basename and bandname (remapped if in _bandmap) """
-        #from nose.tools import set_trace; set_trace()
-        m = re.match(cls._pattern, os.path.basename(filename))
+        m = cls.regex().match(os.path.basename(filename))
         basename = m.group(1)
         bandname = cls._bandmap.get(m.group(2), m.group(2))
         return basename, bandname
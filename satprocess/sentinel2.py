@@ -1,6 +1,7 @@
 
 from .scene import Scene
-from .product import TOA as _TOA, NDVI, EVI, Color
+from .product import Product, TOA as _TOA, NDVI, EVI, NDWI, SAVI, Color as _Color, index_product
+from .harmonize import HarmonizedImage
 
 
 class TOA(_TOA):
@@ -18,6 +19,36 @@ class TOA(_TOA):
         return self.geoimg
 
 
+class Harmonized(Product):
+    """ Bands of all resolutions resampled to the 10m grid. Coarser bands missing from the tile
+        are left out (see Sentinel2Scene) """
+    name = 'harmonized'
+    description = 'Sentinel2 TOA bands resampled to 10m'
+
+    dependencies = {'toa': [], 'swir': [], 'cbands': []}
+
+    def process(self, **kwargs):
+        super(Harmonized, self).process(**kwargs)
+        if self.geoimg is None:
+            geoimgs = dict(zip(self.dependencies, self.get_dependencies()))
+            harmonized = HarmonizedImage(geoimgs['toa'], [geoimgs[d] for d in ['swir', 'cbands'] if d in geoimgs])
+            if self.virtual:
+                self.geoimg = harmonized
+            else:
+                bands = list(harmonized.bandnames())
+                self.geoimg = self.stream(harmonized, bands, lambda arrs: [arrs[b] for b in bands], bands)
+        return self.geoimg
+
+
+class Color(_Color):
+    """ Color composite of any bands (e.g., swir1, nir, red) on the 10m grid """
+
+    dependencies = {'harmonized': []}
+
+
+NBR = index_product('nbr', description='Normalized Burn Ratio, with SWIR resampled to 10m', product='harmonized')
+
+
 class Sentinel2Scene(Scene):
     description = 'Sentinel2 Scene'
 
@@ -25,8 +56,12 @@ class Sentinel2Scene(Scene):
         'toa': TOA,
         'swir': TOA,
         'cbands': TOA,
+        'harmonized': Harmonized,
         'ndvi': NDVI,
         'evi': EVI,
+        'ndwi': NDWI,
+        'savi': SAVI,
+        'nbr': NBR,
         'color': Color
     }
 
@@ -49,3 +84,7 @@ class Sentinel2Scene(Scene):
         self.add_bands('toa', ['blue', 'green', 'red', 'nir'])
         self.add_bands('swir', ['swir1', 'swir2'])
         self.add_bands('cbands', ['coastal', 'cirrus'])
+        # harmonize only the coarser bands present in the tile
+        for name in ['swir', 'cbands']:
+            if len(self[name].sources) == 0:
+                del self['harmonized'].dependencies[name]
@@ -0,0 +1,215 @@
+"""
+    Resident processing service: a pool of warm worker processes taking jobs over a local HTTP/JSON API
+"""
+
+import time
+import json
+import uuid
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from multiprocessing import Process, Queue
+from six.moves import queue as _queue
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn
+from .batch import _init_worker
+from . import cog as _cog
+
+
+logger = logging.getLogger(__name__)
+
+# maximum threads per product a job can ask for
+MAXWORKERS = 8
+
+
+def _integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# processing options a job submitted over HTTP may give, with a check of each value
+OPTIONS = {
+    'cog': lambda v: isinstance(v, bool) or (isinstance(v, dict) and set(v) <= set(_cog.DEFAULTS)),
+    'masked': lambda v: isinstance(v, bool),
+    'tilesize': lambda v: _integer(v) and v > 0,
+    'workers': lambda v: _integer(v) and 0 < v <= MAXWORKERS,
+}
+
+
+def job_options(options):
+    """ Check options of a job submitted over HTTP, raising ValueError if not allowed """
+    if not isinstance(options, dict):
+        raise ValueError('options must be an object')
+    for k, v in options.items():
+        if k not in OPTIONS:
+            raise ValueError('option %s not allowed, use %s' % (k, ' '.join(sorted(OPTIONS))))
+        if not OPTIONS[k](v):
+            raise ValueError('invalid %s option %s' % (k, json.dumps(v)))
+    return options
+
+
+def _worker(cls, inbox, outbox, outpath, maxscenes, maxfiles):
+    """ Process jobs from inbox, keeping the most recently used maxscenes Scenes open """
+    _init_worker()
+    scenes = OrderedDict()
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+        id, path, aoi, products, kwargs = job
+        outbox.put((id, 'running', {}))
+        start = time.time()
+        try:
+            # scenes clipped to different AOIs are different scenes
+            key = (path, json.dumps(aoi, sort_keys=True))
+            scene = scenes.pop(key, None)
+            if scene is None:
+                scene = cls.create_from_directory(path, outpath=outpath, manifest=True, maxfiles=maxfiles, aoi=aoi)
+            scenes[key] = scene
+            while len(scenes) > maxscenes:
+                scenes.popitem(last=False)[1].close()
+            # products from earlier jobs may have other options, and are reopened from the manifest if the same
+            scene.reset(products)
+            geoimgs = scene.process(products, **kwargs)
+            result = {'outputs': {p: geoimgs[p].filename() for p in products}}
+            status = 'done'
+        except Exception as e:
+            result = {'error': '%s: %s' % (e.__class__.__name__, e)}
+            status = 'failed'
+            logger.debug(traceback.format_exc())
+        result['time'] = time.time() - start
+        outbox.put((id, status, result))
+    for scene in scenes.values():
+        scene.close()
+
+
+class Service(object):
+    """ Pool of worker processes, started once so imports and GDAL driver registration are paid
+        once rather than per job. Jobs for the same scene go to the same worker, which keeps
+        recently used Scenes (and their products) open. Each worker queues at most maxqueue
+        jobs, beyond which submit raises queue.Full so callers can back off """
+
+    def __init__(self, cls, processes=2, outpath='./', maxqueue=8, maxscenes=16, maxfiles=None, maxjobs=10000):
+        self.cls = cls
+        self.maxjobs = maxjobs
+        self.outbox = Queue()
+        self.inboxes = [Queue(maxqueue) for i in range(processes)]
+        self.workers = [Process(target=_worker, args=(cls, inbox, self.outbox, outpath, maxscenes, maxfiles))
+                        for inbox in self.inboxes]
+        # {id: job status}, oldest first
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        for w in self.workers:
+            w.daemon = True
+            w.start()
+        self.collector = threading.Thread(target=self._collect)
+        self.collector.daemon = True
+        self.collector.start()
+
+    def _collect(self):
+        """ Update job status from worker messages """
+        while True:
+            msg = self.outbox.get()
+            if msg is None:
+                break
+            id, status, result = msg
+            with self.lock:
+                if id in self.jobs:
+                    self.jobs[id]['status'] = status
+                    self.jobs[id].update(result)
+
+    def submit(self, scene, products, aoi=None, **kwargs):
+        """ Queue job to process products of the scene directory, optionally clipped to aoi
+            (see satprocess.scene.Scene), returning job id """
+        id = uuid.uuid4().hex
+        job = {'id': id, 'scene': scene, 'products': products, 'status': 'queued', 'submitted': time.time()}
+        with self.lock:
+            self.jobs[id] = job
+            # forget the oldest finished jobs
+            for old in [i for i, j in self.jobs.items() if j['status'] in ['done', 'failed']]:
+                if len(self.jobs) <= self.maxjobs:
+                    break
+                del self.jobs[old]
+        inbox = self.inboxes[hash(scene) % len(self.inboxes)]
+        try:
+            inbox.put_nowait((id, scene, aoi, products, kwargs))
+        except _queue.Full:
+            with self.lock:
+                del self.jobs[id]
+            raise
+        return id
+
+    def status(self, id=None):
+        """ Get status of job id, or of the service """
+        with self.lock:
+            if id is not None:
+                return dict(self.jobs[id]) if id in self.jobs else None
+            counts = {}
+            for j in self.jobs.values():
+                counts[j['status']] = counts.get(j['status'], 0) + 1
+        return {'workers': len([w for w in self.workers if w.is_alive()]), 'jobs': counts}
+
+    def close(self):
+        """ Stop workers once their queued jobs are done """
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for w in self.workers:
+            w.join()
+        self.outbox.put(None)
+        self.collector.join()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ POST /jobs {"scene": path, "products": [...], "aoi": bbox or GeoJSON, "options": {...}} to submit a job,
+        GET /jobs/<id> for its status, GET /status for the service status. Options are limited
+        to those in OPTIONS """
+
+    def respond(self, code, body, headers={}):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/status':
+            return self.respond(200, service.status())
+        if self.path.startswith('/jobs/'):
+            job = service.status(self.path[len('/jobs/'):])
+            if job is not None:
+                return self.respond(200, job)
+        self.respond(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self.respond(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            req = json.loads(self.rfile.read(length).decode('utf-8'))
+            scene, products = req['scene'], req['products']
+            if not isinstance(products, list) or not all([isinstance(p, type(u'')) for p in products]):
+                raise ValueError('products must be a list of names')
+            options = job_options(req.get('options', {}))
+        except (ValueError, KeyError, TypeError) as e:
+            return self.respond(400, {'error': 'invalid job: %s' % e})
+        try:
+            id = self.server.service.submit(scene, products, aoi=req.get('aoi'), **options)
+        except _queue.Full:
+            return self.respond(503, {'error': 'queue full'}, headers={'Retry-After': '1'})
+        self.respond(202, {'id': id})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """ HTTP server for a Service """
+    daemon_threads = True
+
+    def __init__(self, service, host='127.0.0.1', port=8080):
+        HTTPServer.__init__(self, (host, port), Handler)
+        self.service = service
@@ -0,0 +1,95 @@
+"""
+    Mergeable statistics of band values, computed exactly in one pass or from a sample
+"""
+
+import math
+import numpy as np
+from .errors import SatProcessError
+
+
+def samplesize(error, confidence=0.95):
+    """ Number of samples so percentiles are within error (as a fraction of ranks) with confidence,
+        from the Dvoretzky-Kiefer-Wolfowitz inequality """
+    return int(math.ceil(math.log(2.0 / (1 - confidence)) / (2 * error ** 2)))
+
+
+class Stats(object):
+    """ Count, min, max, mean and variance of values, with a histogram of bins between bounds
+        if given. If sampled, values are also kept for percentiles. Stats of separate blocks
+        can be merged, giving the same result as one pass over all of them """
+
+    def __init__(self, bounds=None, bins=1000, sampled=False):
+        self.bounds = bounds
+        self.bins = bins
+        self.sampled = sampled
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        # sum of squared differences from the mean
+        self.m2 = 0.0
+        self.hist = None if bounds is None else np.zeros(bins, dtype='int64')
+        self.samples = []
+
+    def update(self, values):
+        """ Add 1D array of (valid) values """
+        other = Stats(bounds=self.bounds, bins=self.bins, sampled=self.sampled)
+        values = values.astype('float64')
+        other.count = values.size
+        if other.count > 0:
+            other.min = values.min()
+            other.max = values.max()
+            other.mean = values.mean()
+            other.m2 = ((values - other.mean) ** 2).sum()
+            if other.hist is not None:
+                other.hist = np.histogram(np.clip(values, *self.bounds), bins=self.bins, range=self.bounds)[0]
+            if self.sampled:
+                other.samples = [values.astype('float32')]
+        self.merge(other)
+        return self
+
+    def merge(self, other):
+        """ Merge stats of other values into these """
+        count = self.count + other.count
+        if other.count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.hist is not None:
+            self.hist += other.hist
+        self.samples.extend(other.samples)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count > 0 else np.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def percentile(self, q):
+        """ Get percentile(s) q, from the sample if sampled, otherwise from the histogram """
+        if self.count == 0:
+            raise SatProcessError('no valid values for percentiles')
+        if self.sampled:
+            return np.percentile(np.concatenate(self.samples), q)
+        if self.hist is None:
+            raise SatProcessError('percentiles require bounds or sampling')
+        # interpolate within bins of the cumulative histogram
+        cum = np.concatenate([[0], np.cumsum(self.hist)]) / float(self.count)
+        edges = np.linspace(self.bounds[0], self.bounds[1], self.bins + 1)
+        return np.interp(np.array(q) / 100.0, cum, edges)
+
+    def summary(self, percentiles=[2, 50, 98]):
+        """ Get dictionary of statistics, e.g., for QA reports """
+        summary = {'count': self.count, 'min': float(self.min), 'max': float(self.max),
+                   'mean': float(self.mean), 'std': float(self.std) if self.count > 0 else np.nan}
+        if self.count > 0 and (self.sampled or self.hist is not None):
+            for p, v in zip(percentiles, self.percentile(percentiles)):
+                summary['p%g' % p] = float(v)
+        return summary
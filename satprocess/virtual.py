@@ -0,0 +1,89 @@
+"""
+    Virtual rasters: per-band operations on another raster, evaluated one block at a time when read
+"""
+
+
+def read(geoimg, bands, chunk, masks=False):
+    """ Read chunk of bands of a GeoImage or VirtualImage as {band: float32 array}, along with
+        mask of valid pixels of all bands, or {band: mask of valid pixels} if masks """
+    if isinstance(geoimg, VirtualImage):
+        return geoimg.read(bands, chunk, masks=masks)
+    arrs = {}
+    valid = {}
+    for b in bands:
+        arrs[b] = geoimg[b].read(chunk).astype('float32')
+        valid[b] = geoimg[b].data_mask(chunk).astype('bool')
+    return arrs, (valid if masks else combine(valid, bands))
+
+
+def combine(masks, bands):
+    """ Get mask of pixels valid in all bands from {band: mask} """
+    valid = None
+    for b in bands:
+        valid = masks[b] if valid is None else valid & masks[b]
+    return valid
+
+
+def base(geoimg):
+    """ Get GeoImage a (possibly nested) VirtualImage is computed from """
+    while isinstance(geoimg, VirtualImage):
+        geoimg = geoimg.geoimg
+    return geoimg
+
+
+def files(geoimg):
+    """ Get set of files held open by a GeoImage, or by the GeoImages a VirtualImage reads """
+    if isinstance(geoimg, VirtualImage):
+        return geoimg.files()
+    return set(geoimg.filenames())
+
+
+def linear(gain, offset):
+    """ Get operation applying gain and offset in place to a float32 array """
+    def func(arr):
+        arr *= gain
+        arr += offset
+        return arr
+    return func
+
+
+class VirtualImage(object):
+    """ Bands computed from the same band of a GeoImage (or another VirtualImage) with a
+        function of a float32 array, such as a gain and offset. Nothing is computed or written
+        until a block is read, so chains of virtual products run in the pass of whatever
+        product finally reads them. Other attributes (size, resolution, chunks) are those
+        of the underlying GeoImage """
+
+    def __init__(self, geoimg, funcs, bandnames=None):
+        self.geoimg = geoimg
+        # {bandname: func(array)}
+        self.funcs = funcs
+        if bandnames is None:
+            bandnames = [b for b in geoimg.bandnames() if b in funcs]
+        self._bandnames = tuple(bandnames)
+
+    def __getattr__(self, attr):
+        return getattr(self.geoimg, attr)
+
+    def bandnames(self):
+        return self._bandnames
+
+    def nbands(self):
+        return len(self._bandnames)
+
+    def bands_exist(self, bands):
+        return all([b in self._bandnames for b in bands])
+
+    def files(self):
+        """ Get set of files held open """
+        return files(self.geoimg)
+
+    def source(self, band):
+        """ Get (GeoImage, func) that band is computed from """
+        return self.geoimg, self.funcs[band]
+
+    def read(self, bands, chunk, masks=False):
+        """ Read chunk of bands as {band: float32 array}, along with mask of valid pixels
+            (or {band: mask} if masks) """
+        arrs, valid = read(self.geoimg, bands, chunk, masks=masks)
+        return {b: self.funcs[b](arrs[b]) for b in bands}, valid
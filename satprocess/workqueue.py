@@ -0,0 +1,82 @@
+"""
+    Work queue of tasks shared by worker processes on one or more nodes, backed by a SQLite file
+"""
+
+import time
+import json
+import sqlite3
+
+
+class WorkQueue(object):
+    """ Queue of tasks in a SQLite database. Workers claim a task with a lease, renew it
+        with heartbeats while working, and ack or fail it when done. Tasks whose lease
+        expires (e.g., the worker crashed) can be claimed by another worker, up to retries
+        attempts in total. Any object with the same claim, heartbeat, ack and fail methods
+        can be used in its place (e.g., for a networked queue) """
+
+    def __init__(self, filename, lease=600, retries=3, timeout=60):
+        self.filename = filename
+        # seconds a claim lasts without a heartbeat
+        self.lease = lease
+        # attempts before a task is failed
+        self.retries = retries
+        # autocommit, with explicit transactions where needed
+        self.db = sqlite3.connect(filename, timeout=timeout, isolation_level=None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS tasks (id TEXT PRIMARY KEY, payload TEXT, state TEXT, '
+                        'attempts INTEGER, worker TEXT, expires REAL, error TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state)')
+
+    def close(self):
+        self.db.close()
+
+    def put(self, id, payload):
+        """ Add task with JSON-serializable payload, returning False if id is already queued """
+        cursor = self.db.execute('INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, 0, NULL, NULL, NULL)',
+                                 (id, json.dumps(payload), 'pending'))
+        return cursor.rowcount > 0
+
+    def claim(self, worker):
+        """ Claim next pending or expired task for worker, returning (id, payload) or None if none left """
+        now = time.time()
+        # an immediate transaction locks the database, so only one worker gets each task
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute("UPDATE tasks SET state = 'failed', error = 'lease expired' "
+                            "WHERE state = 'claimed' AND expires < ? AND attempts >= ?", (now, self.retries))
+            row = self.db.execute("SELECT id, payload FROM tasks WHERE state = 'pending' "
+                                  "OR (state = 'claimed' AND expires < ?) ORDER BY rowid LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE tasks SET state = 'claimed', worker = ?, expires = ?, attempts = attempts + 1 "
+                                "WHERE id = ?", (worker, now + self.lease, row[0]))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def _update(self, id, worker, sql, args):
+        """ Update task if still claimed by worker, returning False if the lease was lost """
+        cursor = self.db.execute(sql + " WHERE id = ? AND worker = ? AND state = 'claimed'", args + (id, worker))
+        return cursor.rowcount > 0
+
+    def heartbeat(self, id, worker):
+        """ Renew lease of claimed task """
+        return self._update(id, worker, 'UPDATE tasks SET expires = ?', (time.time() + self.lease,))
+
+    def ack(self, id, worker):
+        """ Mark claimed task as done """
+        return self._update(id, worker, "UPDATE tasks SET state = 'done', error = NULL", ())
+
+    def fail(self, id, worker, error):
+        """ Release claimed task to be retried, or mark it failed after retries attempts """
+        return self._update(id, worker, "UPDATE tasks SET error = ?, expires = NULL, "
+                            "state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END",
+                            (error, self.retries))
+
+    def counts(self):
+        """ Get number of tasks in each state """
+        return dict(self.db.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+
+    def failures(self):
+        """ Get {id: error} of failed tasks """
+        return dict(self.db.execute("SELECT id, error FROM tasks WHERE state = 'failed'").fetchall())
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+from stestdata import TestData
+from satprocess.landsat8 import Landsat8Scene
+from satprocess.batch import process_scenes, enqueue, work_queue
+from satprocess.workqueue import WorkQueue
+
+
+class DyingScene(Landsat8Scene):
+    """ A scene whose worker process dies while opening it """
+
+    @classmethod
+    def create_from_directory(cls, path, **kwargs):
+        os._exit(1)
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.t = TestData('landsat8')
+        self.path = os.path.dirname(self.t.files[self.t.names[0]][0])
+        self.outpath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outpath)
+
+    def test_process_scenes(self):
+        """ Process products for scenes in a pool of processes """
+        summaries = list(process_scenes(Landsat8Scene, [self.path], ['ndvi'], outpath=self.outpath, processes=2))
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries[0]['error'], None)
+        self.assertTrue('ndvi' in summaries[0]['products'])
+
+    def test_process_scenes_failure(self):
+        """ Failed scenes are reported in the summary rather than raised """
+        paths = [self.path, os.path.join(self.outpath, 'missing')]
+        summaries = list(process_scenes(Landsat8Scene, paths, ['ndvi'], outpath=self.outpath, processes=2))
+        errors = [s['error'] for s in summaries if s['error'] is not None]
+        self.assertEqual(len(errors), 1)
+
+    def test_process_scenes_lost(self):
+        """ Scenes lost with their worker process, or unable to be sent to one, are failed """
+        summaries = list(process_scenes(DyingScene, [self.path], ['ndvi'], outpath=self.outpath, processes=2))
+        self.assertEqual(len(summaries), 1)
+        self.assertTrue('died' in summaries[0]['error'])
+        summaries = list(process_scenes(Landsat8Scene, [self.path], ['ndvi'], outpath=self.outpath, processes=2,
+                                        tilesize=lambda: None))
+        self.assertTrue('pickle' in summaries[0]['error'])
+
+    def test_work_queue(self):
+        """ Process scenes from a queue with a pool of worker processes """
+        filename = os.path.join(self.outpath, 'queue.db')
+        queue = WorkQueue(filename, retries=1)
+        paths = [self.path, os.path.join(self.outpath, 'missing')]
+        self.assertEqual(enqueue(queue, paths, ['ndvi'], outpath=self.outpath), 2)
+        # queueing again does not add scenes
+        self.assertEqual(enqueue(queue, paths, ['ndvi'], outpath=self.outpath), 0)
+        # but they are added for other products
+        self.assertEqual(enqueue(queue, paths[:1], ['evi'], outpath=self.outpath), 1)
+        summaries = work_queue(Landsat8Scene, filename, processes=2)
+        self.assertEqual(len(summaries), 3)
+        self.assertEqual(queue.counts(), {'done': 2, 'failed': 1})
+        queue.close()
@@ -0,0 +1,19 @@
+import unittest
+from satprocess import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        """ Run benchmarks on small synthetic scenes """
+        results = benchmark.run([64], sensors=['landsat8'])
+        for p in benchmark.SENSORS['landsat8']['products']:
+            self.assertTrue(results['landsat8.64.%s' % p]['time'] > 0)
+
+    def test_compare(self):
+        """ Detect regressions against a baseline """
+        baseline = {'a': {'time': 1.0, 'maxrss': 100}, 'b': {'time': 1.0, 'maxrss': 100}}
+        results = {'a': {'time': 1.1, 'maxrss': 100}, 'b': {'time': 1.5, 'maxrss': 100}, 'c': {'time': 9, 'maxrss': 1}}
+        regressions = benchmark.compare(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('b time'))
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+from stestdata import TestData
+from satprocess.landsat8 import Landsat8Scene
+from satprocess.cache import ProductCache, fingerprint
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.t = TestData('landsat8')
+        self.filenames = self.t.files[self.t.names[0]]
+        self.path = tempfile.mkdtemp()
+        self.cache = ProductCache(os.path.join(self.path, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_fingerprint(self):
+        """ Fingerprint files by size and modification time or checksum """
+        fp = fingerprint(self.filenames[0])
+        self.assertEqual(fp['size'], os.path.getsize(self.filenames[0]))
+        # copies elsewhere are the same
+        fname = os.path.join(self.path, os.path.basename(self.filenames[0]))
+        shutil.copy2(self.filenames[0], fname)
+        self.assertEqual(fingerprint(fname), fp)
+        self.assertTrue('sha1' in fingerprint(self.filenames[0], checksum=True))
+
+    def test_fingerprint_vrt(self):
+        """ Fingerprint VRTs by the files they reference """
+        src = os.path.join(self.path, 'src', 'scene_B1.TIF')
+        os.makedirs(os.path.dirname(src))
+        shutil.copy2(self.filenames[0], src)
+        vrt = os.path.join(self.path, 'scene_B1.vrt')
+        with open(vrt, 'w') as f:
+            f.write('<VRTDataset><VRTRasterBand><SimpleSource><SourceFilename relativeToVRT="1">'
+                    'src/scene_B1.TIF</SourceFilename><SrcRect xOff="10" /></SimpleSource></VRTRasterBand>'
+                    '</VRTDataset>')
+        fp = fingerprint(vrt)
+        self.assertEqual(fp['sources'], [fingerprint(src)])
+        self.assertEqual(self.cache.fingerprint(vrt), fp)
+        # changes to the referenced file change the fingerprint
+        os.utime(src, (0, 0))
+        self.assertNotEqual(fingerprint(vrt), fp)
+        self.assertNotEqual(self.cache.fingerprint(vrt), fp)
+
+    def test_fingerprint_once(self):
+        """ Checksums of unchanged inputs are computed once """
+        cache = ProductCache(os.path.join(self.path, 'cache'), checksum=True)
+        fp = cache.fingerprint(self.filenames[0])
+        self.assertTrue(cache.fingerprint(self.filenames[0]) is fp)
+        self.assertEqual(len(cache.fingerprints), 1)
+
+    def test_cached_product(self):
+        """ Reopen cached products instead of processing them """
+        scene = Landsat8Scene(self.filenames, outpath=self.path, cache=self.cache)
+        scene.ndvi()
+        self.assertEqual(len(self.cache.entries()), 1)
+        scene = Landsat8Scene(self.filenames, outpath=self.path, cache=self.cache)
+        # processing again would fail
+        scene['ndvi'].stream = None
+        geoimg = scene.ndvi()
+        self.assertTrue('ndvi' in geoimg.bandnames())
+
+    def test_cache_params(self):
+        """ Products with different parameters are cached separately """
+        scene = Landsat8Scene(self.filenames, outpath=self.path, cache=self.cache)
+        scene.color()
+        scene.color(sd_stretch=1.0)
+        self.assertEqual(len(self.cache.entries()), 2)
+
+    def test_cache_expression(self):
+        """ Indices with different expressions are cached separately """
+        for expression in ['nir / red', 'red / nir']:
+            scene = Landsat8Scene(self.filenames, outpath=tempfile.mkdtemp(dir=self.path), cache=self.cache)
+            scene.add_index('ratio', expression)
+            scene.ratio()
+        self.assertEqual(len(self.cache.entries()), 2)
+
+    def test_evict(self):
+        """ Evict entries when cache is larger than maxsize """
+        self.cache.maxsize = 0
+        scene = Landsat8Scene(self.filenames, outpath=self.path, cache=self.cache)
+        scene.ndvi()
+        self.assertEqual(self.cache.size(), 0)
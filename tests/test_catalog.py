@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+from satprocess.catalog import walk, Catalog
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        for d in ['026/037/a', '026/037/b', '027/037/a']:
+            os.makedirs(os.path.join(self.path, d))
+            for b in ['B1', 'B2']:
+                open(os.path.join(self.path, d, 'scene_%s.TIF' % b), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def files(self, walker):
+        return sorted([os.path.join(d, f) for d, files in walker for f in files])
+
+    def test_walk(self):
+        """ Walk nested directories """
+        files = self.files(walk(self.path))
+        self.assertEqual(len(files), 6)
+        self.assertTrue(os.path.join(self.path, '026/037/b', 'scene_B2.TIF') in files)
+
+    def test_catalog(self):
+        """ Repeat scans use the index for unchanged directories """
+        fout, dbfile = tempfile.mkstemp(suffix='.db')
+        os.close(fout)
+        catalog = Catalog(dbfile)
+        self.assertEqual(self.files(catalog.walk(self.path)), self.files(walk(self.path)))
+        # modify indexed listing, unchanged directories are not rescanned
+        d = os.path.join(self.path, '027/037/a')
+        catalog.db.execute('DELETE FROM entries WHERE dir = ?', (d,))
+        self.assertEqual(len(self.files(catalog.walk(self.path))), 4)
+        # changed directories are rescanned
+        os.utime(d, (0, 0))
+        self.assertEqual(len(self.files(catalog.walk(self.path))), 6)
+        catalog.close()
+        os.remove(dbfile)
@@ -0,0 +1,46 @@
+import shutil
+import tempfile
+import unittest
+from stestdata import TestData
+from osgeo import gdal
+from satprocess.landsat8 import Landsat8Scene
+from satprocess.errors import SatProcessError
+from satprocess import cog
+
+
+class TestCOG(unittest.TestCase):
+
+    def setUp(self):
+        self.t = TestData('landsat8')
+        self.filenames = self.t.files[self.t.names[0]]
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_options(self):
+        """ Merge COG options with defaults """
+        opts = cog.options({'compress': 'zstd'})
+        self.assertEqual(opts['blocksize'], 512)
+        copts = cog.creation_options(opts, 'float32')
+        self.assertTrue('COMPRESS=ZSTD' in copts)
+        self.assertTrue('PREDICTOR=3' in copts)
+        self.assertTrue('PREDICTOR=2' in cog.creation_options(opts, 'byte'))
+        with self.assertRaises(SatProcessError):
+            cog.options({'compression': 'zstd'})
+
+    def test_cog_product(self):
+        """ Write product as tiled, compressed COG with overviews """
+        scene = Landsat8Scene(self.filenames, outpath=self.path)
+        geoimg = scene.ndvi(cog={'compress': 'LZW', 'blocksize': 256})
+        ds = gdal.Open(geoimg.filename())
+        self.assertEqual(ds.GetRasterBand(1).GetBlockSize(), [256, 256])
+        self.assertEqual(ds.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE'), 'LZW')
+        self.assertTrue(ds.GetRasterBand(1).GetOverviewCount() > 0)
+
+    def test_cog_thumbnail(self):
+        """ Write Color thumbnail as a COG """
+        scene = Landsat8Scene(self.filenames, outpath=self.path)
+        geoimg = scene.color(size=128, cog={'blocksize': 64, 'overviews': False})
+        ds = gdal.Open(geoimg.filename())
+        self.assertEqual(ds.GetRasterBand(1).GetBlockSize(), [64, 64])
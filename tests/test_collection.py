@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+import unittest
+from stestdata import TestData
+from satprocess.landsat8 import Landsat8Scene
+from satprocess.collection import SceneCollection
+from satprocess.errors import SatProcessError
+
+
+class TestCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.t = TestData('landsat8')
+        self.filenames = self.t.files[self.t.names[0]]
+        self.path = tempfile.mkdtemp()
+        # the same scene twice, with outputs in separate directories
+        scenes = [Landsat8Scene(self.filenames, outpath=tempfile.mkdtemp(dir=self.path)) for i in range(2)]
+        self.collection = SceneCollection(scenes, outpath=self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_group(self):
+        """ Group scenes into collections """
+        collections = SceneCollection.group(self.collection, lambda s: 'pathrow')
+        self.assertEqual(len(collections['pathrow']), 2)
+
+    def test_misaligned(self):
+        """ Scenes of the same size on shifted grids are not reduced """
+        gt = self.collection.scenes[0].dc().geotransform()
+        scenes = []
+        for offset in [100, 101]:
+            aoi = [gt[0] + offset * gt[1], gt[3] + (offset + 100) * gt[5], gt[0] + (offset + 100) * gt[1],
+                   gt[3] + offset * gt[5]]
+            scenes.append(Landsat8Scene(self.filenames, outpath=tempfile.mkdtemp(dir=self.path), aoi=aoi))
+        with self.assertRaises(SatProcessError):
+            SceneCollection(scenes, outpath=self.path).reduce('ndvi', 'max')
+
+    def test_reduce(self):
+        """ Per-pixel reductions of a product over scenes """
+        ndvi = self.collection.scenes[0].ndvi().read()
+        geoimg = self.collection.reduce('ndvi', 'max')
+        self.assertEqual(list(geoimg.bandnames()), ['ndvi_max'])
+        self.assertEqual(geoimg.read().shape, ndvi.shape)
+        geoimg = self.collection.reduce('ndvi', 'count')
+        self.assertEqual(geoimg.read().max(), 2)
+        # histograms in smaller blocks
+        self.collection.tilesize = 2 ** 16
+        geoimg = self.collection.reduce('ndvi', 'percentile', q=90)
+        self.assertEqual(list(geoimg.bandnames()), ['ndvi_p90'])
@@ -0,0 +1,27 @@
+import unittest
+import numpy as np
+from satprocess import indices
+from satprocess.errors import SatProcessError
+
+
+class TestIndices(unittest.TestCase):
+
+    def test_bands(self):
+        """ Get bands used by expression """
+        self.assertEqual(indices.bands(indices.INDICES['evi']), ['nir', 'red', 'blue'])
+        self.assertEqual(indices.bands('sqrt(nir) / red'), ['nir', 'red'])
+
+    def test_evaluate(self):
+        """ Evaluate expressions on arrays """
+        arrs = {'nir': np.array([0.5, 0.4]), 'red': np.array([0.1, 0.4])}
+        ndvi = indices.evaluate(indices.INDICES['ndvi'], arrs)
+        self.assertTrue(np.allclose(ndvi, [0.4 / 0.6, 0.0]))
+        with self.assertRaises(SatProcessError):
+            indices.evaluate('nir - blue', arrs)
+
+    def test_invalid(self):
+        """ Reject invalid expressions """
+        with self.assertRaises(SatProcessError):
+            indices.bands('nir -')
+        with self.assertRaises(SatProcessError):
+            indices.bands('nir.__class__')
@@ -0,0 +1,77 @@
+import os
+import pstats
+import logging
+import tempfile
+import unittest
+from satprocess import instrument
+
+
+class TestInstrument(unittest.TestCase):
+
+    def tearDown(self):
+        instrument.disable()
+
+    def test_disabled(self):
+        """ Spans do nothing when no sinks enabled """
+        self.assertTrue(instrument.span('process', product='ndvi') is instrument.NOSPAN)
+        instrument.count('pixels', 10)
+
+    def test_prometheus(self):
+        """ Accumulate spans and counters in Prometheus format """
+        sink = instrument.PrometheusSink()
+        instrument.enable(sink)
+        for i in range(2):
+            with instrument.span('process', product='ndvi'):
+                instrument.count('pixels', 10, product='ndvi')
+        text = sink.text()
+        self.assertTrue('satprocess_span_total{product="ndvi",span="process"} 2' in text)
+        self.assertTrue('satprocess_pixels_total{product="ndvi"} 20' in text)
+
+    def test_prometheus_type(self):
+        """ One TYPE line for each counter, whatever its tags """
+        sink = instrument.PrometheusSink()
+        instrument.enable(sink)
+        instrument.count('pixels', 10, product='ndvi')
+        instrument.count('pixels', 10, product='evi')
+        instrument.count('bytes_written', 5, product='ndvi')
+        lines = sink.text().splitlines()
+        self.assertEqual(lines.count('# TYPE satprocess_pixels_total counter'), 1)
+        self.assertEqual(lines.count('# TYPE satprocess_bytes_written_total counter'), 1)
+        i = lines.index('# TYPE satprocess_pixels_total counter')
+        self.assertTrue(all([line.startswith('satprocess_pixels_total{') for line in lines[i + 1:i + 3]]))
+
+    def test_log(self):
+        """ Log spans as JSON """
+        logger = logging.getLogger('test_instrument')
+        records = []
+        logger.addHandler(logging.Handler())
+        logger.handlers[0].emit = records.append
+        instrument.enable(instrument.LogSink(logger=logger, level=logging.WARNING))
+        with instrument.span('open', product='dc'):
+            pass
+        self.assertEqual(len(records), 1)
+        self.assertTrue('"span": "open"' in records[0].getMessage())
+
+    def test_profile(self):
+        """ Profile a chosen product """
+        fout, fname = tempfile.mkstemp()
+        os.close(fout)
+        instrument.enable(instrument.ProfileSink('ndvi', fname))
+        with instrument.span('process', product='evi'):
+            pass
+        with instrument.span('process', product='ndvi'):
+            sorted(range(1000))
+        stats = pstats.Stats(fname)
+        self.assertTrue(any(['sorted' in f[2] for f in stats.stats]))
+        os.remove(fname)
+
+    def test_profile_fused(self):
+        """ Profile a product calculated along with others """
+        fout, fname = tempfile.mkstemp()
+        os.close(fout)
+        instrument.enable(instrument.ProfileSink('evi', fname))
+        with instrument.span('process', product='ndvi', fused='ndvi evi'):
+            sorted(range(1000))
+        stats = pstats.Stats(fname)
+        self.assertTrue(any(['sorted' in f[2] for f in stats.stats]))
+        os.remove(fname)
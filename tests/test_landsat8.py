@@ -1,7 +1,13 @@
+import os
+import glob
+import math
+import tempfile
 import unittest
 from stestdata import TestData
-from satprocess.landsat8 import Landsat8Scene
+import numpy as np
+from satprocess.landsat8 import Landsat8Scene, Calibration, Mask
 from satprocess.errors import SatProcessError
+from satprocess.virtual import VirtualImage
 
 
 class TestProduct(unittest.TestCase):
@@ -50,3 +56,92 @@ class TestProduct(unittest.TestCase):
         geoimg = scene.evi()
         self.assertEquals(geoimg.nbands(), 1)
         self.assertTrue('evi' in geoimg.bandnames())
+
+    def test_calibration(self):
+        """ Calibration coefficients from MTL metadata """
+        fout, fname = tempfile.mkstemp(suffix='_MTL.txt')
+        with os.fdopen(fout, 'w') as f:
+            f.write(MTL)
+        cal = Calibration.from_mtl(fname, Landsat8Scene._bandmap)
+        os.remove(fname)
+        self.assertEqual(cal.radiance('red'), (0.01, -50.0))
+        gain, offset = cal.reflectance('red')
+        self.assertAlmostEqual(gain, 2e-5 / math.sin(math.radians(30.0)))
+        self.assertAlmostEqual(offset, -0.1 / math.sin(math.radians(30.0)))
+        with self.assertRaises(SatProcessError):
+            cal.radiance('nir')
+
+    def test_rad(self):
+        """ Radiance from digital counts """
+        scene = Landsat8Scene(self.filenames)
+        geoimg = scene.rad()
+        self.assertEqual(geoimg.nbands(), 8)
+
+    def test_virtual(self):
+        """ Virtual TOA is computed when read by NDVI, without writing a file """
+        scene = Landsat8Scene(self.filenames, outpath=tempfile.mkdtemp())
+        toa = scene.toa(virtual=True)
+        self.assertTrue(isinstance(toa, VirtualImage))
+        self.assertEqual(toa.nbands(), 8)
+        self.assertEqual(glob.glob(scene['toa'].filename + '*'), [])
+        geoimg = scene.process(['ndvi'])['ndvi']
+        self.assertTrue('ndvi' in geoimg.bandnames())
+        self.assertEqual(glob.glob(scene['toa'].filename + '*'), [])
+
+    def test_virtual_intermediate(self):
+        """ Intermediates are only virtual while processing the products needing them """
+        scene = Landsat8Scene(self.filenames, outpath=tempfile.mkdtemp())
+        scene.process(['ndvi'])
+        self.assertFalse(scene['toa'].virtual)
+        toa = scene.process(['toa'])['toa']
+        self.assertFalse(isinstance(toa, VirtualImage))
+        self.assertEqual(toa.filename(), glob.glob(scene['toa'].filename + '*')[0])
+
+    def test_required_bands(self):
+        """ Only the digital counts bands read by a product are opened """
+        scene = Landsat8Scene(self.filenames, outpath=tempfile.mkdtemp())
+        scene.ndvi()
+        self.assertEqual(sorted(scene['dc'].geoimg.bandnames()), ['nir', 'red'])
+        self.assertEqual(glob.glob(scene['toa'].filename + '*'), [])
+        scene.evi()
+        self.assertEqual(sorted(scene['dc'].geoimg.bandnames()), ['blue', 'nir', 'red'])
+        self.assertEqual(scene.dc().nbands(), 8)
+
+    def test_mask_decode(self):
+        """ Decode quality bits """
+        qa = np.array([1, 2720, 2800, 2976, 6816, 2724])
+        self.assertEqual(list(Mask.decode(qa)), [True, False, True, True, True, False])
+        self.assertEqual(list(Mask.decode(qa, fields=['fill'])), [True] + [False] * 5)
+
+    def test_masked(self):
+        """ Masked products exclude flagged pixels """
+        scene = Landsat8Scene(self.filenames)
+        mask = scene.mask()
+        self.assertEqual(list(mask.bandnames()), ['mask'])
+        ndvi = scene.ndvi(masked=True, filename='ndvi_masked')
+        clear = mask[0].data_mask().astype('bool')
+        self.assertFalse(ndvi[0].data_mask().astype('bool')[~clear].any())
+
+    def test_pansharpen(self):
+        """ Pansharpened visible bands at pan resolution """
+        scene = Landsat8Scene(self.filenames)
+        geoimg = scene.pansharpen(tilesize=2 ** 16)
+        self.assertEqual(list(geoimg.bandnames()), ['red', 'green', 'blue'])
+        pan = scene.pan()
+        self.assertEqual((geoimg.xsize(), geoimg.ysize()), (pan.xsize(), pan.ysize()))
+
+
+MTL = """GROUP = L1_METADATA_FILE
+  GROUP = IMAGE_ATTRIBUTES
+    SUN_ELEVATION = 30.0
+    EARTH_SUN_DISTANCE = 1.0
+  END_GROUP = IMAGE_ATTRIBUTES
+  GROUP = RADIOMETRIC_RESCALING
+    RADIANCE_MULT_BAND_4 = 1.0000E-02
+    RADIANCE_ADD_BAND_4 = -50.00000
+    REFLECTANCE_MULT_BAND_4 = 2.0000E-05
+    REFLECTANCE_ADD_BAND_4 = -0.100000
+  END_GROUP = RADIOMETRIC_RESCALING
+END_GROUP = L1_METADATA_FILE
+END
+"""
@@ -0,0 +1,96 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from stestdata import TestData
+from satprocess.landsat8 import Landsat8Scene
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.t = TestData('landsat8')
+        self.filenames = self.t.files[self.t.names[0]]
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_scene(self, filenames=None):
+        return Landsat8Scene(self.filenames if filenames is None else filenames, outpath=self.path, manifest=True)
+
+    def copy_inputs(self):
+        """ Copy the scene's files, keeping their times, to a new directory """
+        path = tempfile.mkdtemp(dir=self.path)
+        basename = Landsat8Scene.parse_filename(self.filenames[0])[0]
+        metadata = os.path.join(os.path.dirname(self.filenames[0]), basename + '_MTL.txt')
+        for f in list(self.filenames) + ([metadata] if os.path.exists(metadata) else []):
+            shutil.copy2(f, path)
+        return [os.path.join(path, os.path.basename(f)) for f in self.filenames]
+
+    def rebuilt(self, scene, products, **kwargs):
+        """ Process products, returning those that were generated rather than reopened """
+        built = []
+
+        def spy(name, create):
+            def wrapped(*args, **kwargs):
+                built.append(name)
+                return create(*args, **kwargs)
+            return wrapped
+
+        for name in products:
+            scene[name].create = spy(name, scene[name].create)
+        scene.process(products, **kwargs)
+        return built
+
+    def test_manifest(self):
+        """ Record generated products in a manifest alongside the outputs """
+        scene = self.get_scene()
+        scene.process(['ndvi'])
+        with open(scene.manifest.filename) as f:
+            entries = json.load(f)
+        self.assertTrue('ndvi' in entries)
+        self.assertEqual(entries['ndvi']['filename'], scene['ndvi'].geoimg.filename())
+
+    def test_up_to_date(self):
+        """ Reopen up to date products without processing them or their dependencies """
+        self.get_scene().process(['ndvi'])
+        scene = self.get_scene()
+        # processing again would fail
+        scene['ndvi'].create = None
+        scene['toa'].stream = None
+        geoimg = scene.process(['ndvi'])['ndvi']
+        self.assertTrue('ndvi' in geoimg.bandnames())
+
+    def test_stale(self):
+        """ Rebuild products when an input file is modified """
+        filenames = self.copy_inputs()
+        self.assertEqual(self.rebuilt(self.get_scene(filenames), ['ndvi']), ['ndvi'])
+        self.assertEqual(self.rebuilt(self.get_scene(filenames), ['ndvi']), [])
+        red = [f for f in filenames if Landsat8Scene.parse_filename(f)[1] == 'red'][0]
+        st = os.stat(red)
+        os.utime(red, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(self.rebuilt(self.get_scene(filenames), ['ndvi']), ['ndvi'])
+
+    def test_stale_option(self):
+        """ Rebuild products processed with different options """
+        self.assertEqual(self.rebuilt(self.get_scene(), ['ndvi']), ['ndvi'])
+        self.assertEqual(self.rebuilt(self.get_scene(), ['ndvi'], masked=True), ['ndvi'])
+        self.assertEqual(self.rebuilt(self.get_scene(), ['ndvi'], masked=True), [])
+
+    def test_staged(self):
+        """ Products are up to date for a copy of the inputs staged elsewhere (e.g., scratch space) """
+        self.assertEqual(self.rebuilt(self.get_scene(), ['ndvi']), ['ndvi'])
+        self.assertEqual(self.rebuilt(self.get_scene(self.copy_inputs()), ['ndvi']), [])
+
+    def test_stale_expression(self):
+        """ Rebuild an index when its expression changes """
+        scene = self.get_scene()
+        scene.add_index('ratio', 'nir / red')
+        ratio = scene.process(['ratio'])['ratio'][0].read()
+        scene = self.get_scene()
+        scene.add_index('ratio', 'red / nir')
+        self.assertTrue(scene.manifest.stale(scene['ratio']))
+        geoimg = scene.process(['ratio'])['ratio']
+        self.assertFalse((geoimg[0].read() == ratio).all())
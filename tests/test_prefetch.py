@@ -0,0 +1,98 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from satprocess.prefetch import Prefetcher
+
+
+DELAY = 0.05
+
+
+class SlowFile(object):
+    """ Stand-in for a file on a slow filesystem, each read takes DELAY seconds """
+
+    def __init__(self, filename, mode):
+        self.f = open(filename, mode)
+
+    def read(self, *args):
+        time.sleep(DELAY)
+        return self.f.read(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.f.close()
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.items = []
+        for i in range(4):
+            d = os.path.join(self.path, 'scene%s' % i)
+            os.makedirs(d)
+            for b in ['B1', 'B2']:
+                with open(os.path.join(d, 'scene%s_%s.TIF' % (i, b)), 'wb') as f:
+                    f.write(b'x' * 1000)
+            self.items.append(d)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_overlap(self):
+        """ Staging overlaps with processing """
+        prefetcher = Prefetcher(opener=SlowFile, blocksize=500)
+        start = time.time()
+        for item, path in prefetcher.stage(self.items):
+            self.assertEqual(item, path)
+            # processing takes as long as staging
+            time.sleep(4 * DELAY)
+            prefetcher.release(item)
+        # staging takes 2 files x 3 reads per item, so serially 4 items would take 4 x 10 x DELAY
+        self.assertTrue(time.time() - start < 4 * 10 * DELAY * 0.8)
+
+    def test_scratch(self):
+        """ Stage copies in scratch directory, removed on release """
+        scratch = os.path.join(self.path, 'scratch')
+        os.makedirs(scratch)
+        prefetcher = Prefetcher(scratch=scratch)
+        for item, path in prefetcher.stage(self.items):
+            self.assertEqual(sorted(os.listdir(path)), sorted(os.listdir(item)))
+            for f in os.listdir(path):
+                self.assertEqual(os.path.getmtime(os.path.join(path, f)), os.path.getmtime(os.path.join(item, f)))
+            prefetcher.release(item)
+            self.assertFalse(os.path.exists(path))
+
+    def test_missing(self):
+        """ Items that fail to stage are given unstaged, without stopping others """
+        scratch = os.path.join(self.path, 'scratch')
+        os.makedirs(scratch)
+        prefetcher = Prefetcher(scratch=scratch)
+        items = self.items[:1] + [os.path.join(self.path, 'missing')] + self.items[1:]
+        staged = []
+        for item, path in prefetcher.stage(items):
+            staged.append(item)
+            if item == items[1]:
+                self.assertEqual(path, item)
+            else:
+                self.assertNotEqual(path, item)
+            prefetcher.release(item)
+        self.assertEqual(staged, items)
+        self.assertEqual(os.listdir(scratch), [])
+        self.assertEqual(prefetcher.nbytes, 0)
+
+    def test_budget(self):
+        """ Staged bytes not released are limited by budget """
+        prefetcher = Prefetcher(depth=4, budget=4000)
+        staged = []
+        for item, path in prefetcher.stage(self.items):
+            staged.append(item)
+            self.assertTrue(prefetcher.nbytes <= 4000)
+            if len(staged) == 2:
+                for s in staged:
+                    prefetcher.release(s)
+                staged = []
+        self.assertEqual(prefetcher.nbytes, 0)
@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 from stestdata import TestData
 from satprocess.scene import Scene
 from nose.tools import set_trace
@@ -46,3 +47,66 @@ class TestProduct(unittest.TestCase):
         self.assertEqual(['red', 'green', 'blue'], list(geoimg.bandnames()))
         with self.assertRaises(Exception):
             geoimg = scene.color(['aqua', 'teal', 'turqouise'])
+
+    def test_tiled(self):
+        """ Products streamed with small tiles match those with large tiles """
+        scene = self.get_scene(bandnames=self.bandnames)
+        ndvi = scene.ndvi(tilesize=2 ** 22)[0].read()
+        scene = self.get_scene(bandnames=self.bandnames, basename='tiled')
+        geoimg = scene.ndvi(tilesize=2 ** 12)
+        self.assertTrue(len(scene['ndvi'].chunks(geoimg)) > 1)
+        self.assertTrue((geoimg[0].read() == ndvi).all())
+
+    def test_workers(self):
+        """ Products processed by multiple threads match those from one thread """
+        scene = self.get_scene(bandnames=self.bandnames)
+        evi = scene.evi(tilesize=2 ** 12)[0].read()
+        scene = self.get_scene(bandnames=self.bandnames, basename='threaded')
+        geoimg = scene.evi(tilesize=2 ** 12, workers=4)
+        self.assertTrue((geoimg[0].read() == evi).all())
+
+    def test_fused_indices(self):
+        """ Calculate several indices in a single pass """
+        scene = self.get_scene(bandnames=self.bandnames)
+        scene.add_index('ndvi2', '(nir - red) / (nir + red)')
+        geoimgs = scene.process(['ndvi', 'ndvi2', 'savi'])
+        for p in ['ndvi', 'ndvi2', 'savi']:
+            self.assertEqual(list(geoimgs[p].bandnames()), [p])
+        self.assertTrue((geoimgs['ndvi'][0].read() == geoimgs['ndvi2'][0].read()).all())
+
+    def test_fused_valid(self):
+        """ Fused indices are valid where their own bands are, as if calculated alone """
+        scene = self.get_scene(bandnames=self.bandnames, basename='alone')
+        ndvi = scene.ndvi()[0].read()
+        scene = self.get_scene(bandnames=self.bandnames, basename='fused')
+        # swir2 (used by nbr only) is nodata where nir and red are not
+        swir2 = scene['dc'].geoimg['swir2']
+        swir2.set_nodata(float(np.median(swir2.read())))
+        geoimgs = scene.process(['ndvi', 'nbr'])
+        self.assertTrue((geoimgs['ndvi'][0].read() == ndvi).all())
+        nodata = geoimgs['nbr'][0].nodata()
+        self.assertTrue((geoimgs['nbr'][0].read() == nodata).sum() > (ndvi == nodata).sum())
+
+    def test_statistics(self):
+        """ Statistics are computed once and reused by Color """
+        scene = self.get_scene(bandnames=self.bandnames)
+        stats = scene['ndvi'].statistics(bounds=(-1, 1))
+        ndvi = scene.ndvi()[0].read()
+        valid = ndvi != scene.ndvi()[0].nodata()
+        self.assertEqual(stats['ndvi'].count, valid.sum())
+        self.assertAlmostEqual(stats['ndvi'].mean, ndvi[valid].mean(), places=4)
+        self.assertTrue(scene['ndvi'].statistics(bounds=(-1, 1))['ndvi'] is stats['ndvi'])
+        scene.color()
+        stats = scene['toa'].statistics(['red', 'green', 'blue'], error=scene['color'].error)
+        self.assertTrue(stats['red'].sampled)
+        self.assertEqual(len(scene['toa'].stats), 3)
+
+    def test_thumbnail(self):
+        """ Color thumbnail from decimated reads """
+        scene = self.get_scene(bandnames=self.bandnames)
+        geoimg = scene.color(size=128)
+        self.assertEqual(max(geoimg.xsize(), geoimg.ysize()), 128)
+        self.assertEqual(list(geoimg.bandnames()), ['red', 'green', 'blue'])
+        self.assertTrue(geoimg[0].read().max() > 0)
+        # stretch is from the decimated bands
+        self.assertTrue(all([options[-1] == 128 for band, options in scene['toa'].stats]))
@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+from satprocess.reductions import reduction
+from satprocess.errors import SatProcessError
+
+
+class TestReductions(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.arrs = [np.random.uniform(-1, 1, (3, 4)).astype('float32') for i in range(25)]
+        self.valid = [np.ones((3, 4), dtype='bool') for a in self.arrs]
+        # no valid observations of one pixel
+        for v in self.valid:
+            v[2, 3] = False
+
+    def reduce(self, name, **kwargs):
+        r = reduction(name, (3, 4), **kwargs)
+        for arr, valid in zip(self.arrs, self.valid):
+            r.update(arr, valid)
+        return r.result()
+
+    def test_reductions(self):
+        """ Reductions match numpy, with NaN where there are no valid pixels """
+        stack = np.array(self.arrs)
+        for name, func in [('max', np.max), ('min', np.min), ('mean', np.mean)]:
+            out = self.reduce(name)
+            np.testing.assert_allclose(out.ravel()[:-1], func(stack, axis=0).ravel()[:-1], rtol=1e-5)
+            self.assertTrue(np.isnan(out[2, 3]))
+        self.assertEqual(list(self.reduce('count').ravel()), [25] * 11 + [0])
+
+    def test_percentile(self):
+        """ Median and percentiles from histograms are accurate to the bin width """
+        stack = np.array(self.arrs)
+        out = self.reduce('median', bins=1000)
+        self.assertTrue(np.abs(out - np.median(stack, axis=0)).ravel()[:-1].max() <= 0.002)
+        out = self.reduce('percentile', q=90, bins=1000)
+        self.assertTrue(np.abs(out - np.percentile(stack, 90, axis=0)).ravel()[:-1].max() <= 0.002)
+
+    def test_unknown(self):
+        with self.assertRaises(SatProcessError):
+            reduction('mode', (3, 4))
@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from satprocess import resample
+
+
+class TestResample(unittest.TestCase):
+
+    def test_source_window(self):
+        """ Source window covering target pixels """
+        self.assertEqual(resample.source_window(0, 4, 0.5, 10), (0, 3))
+        self.assertEqual(resample.source_window(4, 4, 0.5, 10), (1, 4))
+        self.assertEqual(resample.source_window(16, 4, 0.5, 10), (7, 3))
+
+    def test_bilinear(self):
+        """ Upsample by 2 with bilinear interpolation """
+        arr = np.arange(16, dtype='float32').reshape(4, 4)
+        rows = resample.grid(0, 8, 0.5, 0, 4)
+        cols = resample.grid(0, 8, 0.5, 0, 4)
+        out = resample.bilinear(arr, rows, cols)
+        self.assertEqual(out.shape, (8, 8))
+        self.assertAlmostEqual(out[1, 1], 1.25, places=5)
+        self.assertEqual(out[0, 0], 0)
+        self.assertEqual(out[7, 7], 15)
+
+    def test_window_matches_full(self):
+        """ Interpolating a window gives the same result as the full array """
+        arr = np.random.rand(10, 10).astype('float32')
+        full = resample.bilinear(arr, resample.grid(0, 20, 0.5, 0, 10), resample.grid(0, 20, 0.5, 0, 10))
+        y0, ny = resample.source_window(6, 8, 0.5, 10)
+        x0, nx = resample.source_window(4, 8, 0.5, 10)
+        part = resample.bilinear(arr[y0:y0 + ny, x0:x0 + nx],
+                                 resample.grid(6, 8, 0.5, y0, ny), resample.grid(4, 8, 0.5, x0, nx))
+        self.assertTrue(np.allclose(full[6:14, 4:12], part))
+
+    def test_nearest(self):
+        """ Nearest neighbor upsampling """
+        arr = np.array([[True, False], [False, True]])
+        out = resample.nearest(arr, resample.grid(0, 4, 0.5, 0, 2), resample.grid(0, 4, 0.5, 0, 2))
+        self.assertEqual(out.shape, (4, 4))
+        self.assertTrue(out[0, 0] and out[3, 3] and not out[0, 3])
+
+    def test_cached_grid(self):
+        """ Grids are computed once for each geometry, and are read-only """
+        g = resample.cached_grid(0, 8, 0.5, 0, 4)
+        self.assertTrue(resample.cached_grid(0, 8, 0.5, 0, 4) is g)
+        np.testing.assert_array_equal(g[2], resample.grid(0, 8, 0.5, 0, 4)[2])
+        self.assertFalse(g[0].flags.writeable)
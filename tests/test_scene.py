@@ -3,6 +3,8 @@ import os
 from gippy import GeoImage
 from stestdata import TestData
 from satprocess.scene import Scene
+import satprocess.product as p
+from satprocess.errors import SatProcessError
 from nose.tools import set_trace
 
 
@@ -64,3 +66,80 @@ class TestScene(unittest.TestCase):
         geoimg = scene.dc()
         bname = os.path.basename(os.path.splitext(self.filenames[0])[0])
         self.assertEqual(geoimg.basename(), bname)
+
+    def test_plan(self):
+        """ Plan products in dependency order with shared dependencies once """
+        scene = self.get_scene(bandnames=self.bandnames)
+        order = scene.plan(['ndvi', 'evi', 'color'])
+        self.assertEqual(order[:2], ['dc', 'toa'])
+        self.assertEqual(sorted(order[2:]), ['color', 'evi', 'ndvi'])
+
+    def test_process(self):
+        """ Process multiple products, releasing intermediates """
+        scene = self.get_scene(bandnames=self.bandnames)
+        geoimgs = scene.process(['ndvi', 'evi'])
+        self.assertEqual(sorted(geoimgs.keys()), ['evi', 'ndvi'])
+        self.assertEqual(scene['toa'].geoimg, None)
+        self.assertTrue(scene['dc'].geoimg is not None)
+
+    def test_maxfiles(self):
+        """ Release least recently used products holding too many files open """
+        scene = self.get_scene(bandnames=self.bandnames, maxfiles=0)
+        geoimg = scene.ndvi()
+        self.assertEqual(scene['toa'].geoimg, None)
+        self.assertEqual(scene['ndvi'].geoimg, geoimg)
+        self.assertEqual(list(scene.held.keys()), ['dc', 'ndvi'])
+        self.assertEqual(scene.held['ndvi'], set([geoimg.filename()]))
+
+    def test_reopen(self):
+        """ Released products are reopened from their files rather than processed again """
+        scene = self.get_scene(bandnames=self.bandnames)
+        fname = scene.ndvi().filename()
+        scene['ndvi'].release()
+        self.assertEqual(scene['ndvi']._geoimg, None)
+        # processing again would fail
+        scene['ndvi'].create = None
+        self.assertEqual(scene.ndvi().filename(), fname)
+
+    def test_reset(self):
+        """ Reset options of products, releasing them """
+        scene = self.get_scene(bandnames=self.bandnames)
+        scene.ndvi(tilesize=2 ** 16)
+        scene.reset(['ndvi'])
+        self.assertEqual(scene['ndvi'].tilesize, p.Product.tilesize)
+        self.assertEqual(scene['ndvi'].geoimg, None)
+        self.assertTrue(scene['dc'].geoimg is not None)
+
+    def test_close(self):
+        """ Release all products when the scene is closed """
+        with self.get_scene(bandnames=self.bandnames) as scene:
+            scene.ndvi()
+        self.assertEqual(scene['dc'].geoimg, None)
+        self.assertEqual(scene['ndvi'].geoimg, None)
+
+    def test_aoi(self):
+        """ Products of a scene with an AOI only cover the AOI """
+        full = self.get_scene(bandnames=self.bandnames).ndvi()
+        gt = full.geotransform()
+        # box of 100 x 50 pixels
+        aoi = [gt[0] + 100 * gt[1], gt[3] + 150 * gt[5], gt[0] + 200 * gt[1], gt[3] + 100 * gt[5]]
+        scene = self.get_scene(bandnames=self.bandnames, aoi=aoi)
+        self.assertTrue(scene.basename.startswith('Scene_'))
+        geoimg = scene.ndvi()
+        self.assertEqual((geoimg.xsize(), geoimg.ysize()), (100, 50))
+        self.assertTrue(os.path.dirname(scene['dc'].geoimg.filenames()[0]).endswith('_aoi'))
+
+    def test_aoi_invalid(self):
+        """ AOI must be a valid box intersecting the scene """
+        with self.assertRaises(SatProcessError):
+            self.get_scene(bandnames=self.bandnames, aoi=[1, 1, 0, 0])
+        with self.assertRaises(SatProcessError):
+            self.get_scene(bandnames=self.bandnames, aoi=[-1e9, -1e9, -1e9 + 1, -1e9 + 1])
+
+    def test_scan(self):
+        """ Find scenes in directory tree """
+        path = os.path.dirname(os.path.dirname(self.filenames[0]))
+        scenes = list(Scene.scan(path))
+        self.assertTrue(len(scenes) > 0)
+        for scene in scenes:
+            self.assertTrue(len(scene.filenames) > 0)
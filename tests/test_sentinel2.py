@@ -65,3 +65,50 @@ class TestProduct(unittest.TestCase):
         self.assertEqual(geoimg.nbands(), 3)
         for b in geoimg.bandnames():
             self.assertTrue(b in ['red', 'green', 'blue'])
+
+    def test_harmonized(self):
+        """ Bands of all resolutions on the 10m grid """
+        scene = Sentinel2Scene(self.filenames)
+        geoimg = scene.harmonized()
+        self.assertEqual(geoimg.nbands(), 8)
+        self.assertEqual(geoimg.xsize(), scene.toa().xsize())
+        self.assertEqual(geoimg.resolution().x(), scene.toa().resolution().x())
+
+    def test_nbr(self):
+        """ NBR from harmonized 10m nir and 20m swir2 """
+        scene = Sentinel2Scene(self.filenames)
+        geoimg = scene.process(['nbr'])['nbr']
+        self.assertEqual(list(geoimg.bandnames()), ['nbr'])
+        self.assertEqual(geoimg.xsize(), scene.toa().xsize())
+
+    def test_harmonized_missing(self):
+        """ Harmonize tiles without the coarsest bands """
+        filenames = [f for f in self.filenames if not f.endswith(('B01.jp2', 'B10.jp2'))]
+        scene = Sentinel2Scene(filenames)
+        self.assertEqual(sorted(scene['harmonized'].dependencies), ['swir', 'toa'])
+        geoimg = scene.process(['nbr'])['nbr']
+        self.assertEqual(list(geoimg.bandnames()), ['nbr'])
+
+    def test_color_swir(self):
+        """ Color composite with a 20m band """
+        scene = Sentinel2Scene(self.filenames)
+        geoimg = scene.color(bands=['swir1', 'nir', 'red'])
+        self.assertEqual(list(geoimg.bandnames()), ['swir1', 'nir', 'red'])
+        self.assertEqual(geoimg.xsize(), scene.toa().xsize())
+
+    def test_thumbnail(self):
+        """ Color thumbnail of a tile """
+        scene = Sentinel2Scene(self.filenames)
+        geoimg = scene.color(size=256)
+        self.assertEqual(max(geoimg.xsize(), geoimg.ysize()), 256)
+        self.assertEqual(geoimg.nbands(), 3)
+
+    def test_lazy_open(self):
+        """ Products are only opened when first used """
+        scene = Sentinel2Scene(self.filenames)
+        for p in ['toa', 'swir', 'cbands']:
+            self.assertEqual(scene[p]._geoimg, None)
+        scene.ndvi()
+        self.assertTrue(scene['toa']._geoimg is not None)
+        self.assertEqual(scene['swir']._geoimg, None)
+        self.assertEqual(scene['cbands']._geoimg, None)
@@ -0,0 +1,67 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from six.moves.urllib.request import urlopen, Request
+from six.moves.urllib.error import HTTPError
+from stestdata import TestData
+from satprocess.landsat8 import Landsat8Scene
+from satprocess.service import Service, Server, job_options
+
+
+class TestService(unittest.TestCase):
+
+    def setUp(self):
+        self.t = TestData('landsat8')
+        self.path = os.path.dirname(self.t.files[self.t.names[0]][0])
+        self.outpath = tempfile.mkdtemp()
+        self.service = Service(Landsat8Scene, processes=1, outpath=self.outpath, maxqueue=1)
+        self.server = Server(self.service, port=0)
+        self.url = 'http://127.0.0.1:%s' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        shutil.rmtree(self.outpath)
+
+    def request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        try:
+            resp = urlopen(Request(self.url + path, data=data))
+            return resp.getcode(), json.loads(resp.read().decode('utf-8'))
+        except HTTPError as e:
+            return e.code, json.loads(e.read().decode('utf-8'))
+
+    def test_job(self):
+        """ Submit a job and poll its status """
+        code, resp = self.request('/jobs', {'scene': self.path, 'products': ['ndvi']})
+        self.assertEqual(code, 202)
+        for i in range(600):
+            code, job = self.request('/jobs/%s' % resp['id'])
+            if job['status'] in ['done', 'failed']:
+                break
+            time.sleep(0.1)
+        self.assertEqual(job['status'], 'done')
+        self.assertTrue('ndvi' in job['outputs'])
+        self.assertEqual(self.request('/status')[1]['jobs'], {'done': 1})
+
+    def test_backpressure(self):
+        """ Jobs are rejected when the queue is full """
+        codes = [self.request('/jobs', {'scene': self.path, 'products': ['ndvi', 'evi']})[0] for i in range(5)]
+        self.assertTrue(503 in codes)
+        self.assertEqual(self.request('/jobs', {'scene': self.path})[0], 400)
+        self.assertEqual(self.request('/jobs/missing')[0], 404)
+
+    def test_options(self):
+        """ Only allowed job options are accepted """
+        self.assertEqual(job_options({'cog': True, 'masked': True, 'tilesize': 2 ** 20, 'workers': 2})['workers'], 2)
+        for options in [[1], {'filename': '/tmp/x'}, {'workers': 1000}, {'tilesize': True}, {'cog': {'x': 1}}]:
+            with self.assertRaises(ValueError):
+                job_options(options)
+            body = {'scene': self.path, 'products': ['ndvi'], 'options': options}
+            self.assertEqual(self.request('/jobs', body)[0], 400)
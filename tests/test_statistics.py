@@ -0,0 +1,39 @@
+import unittest
+import numpy as np
+from satprocess.statistics import Stats, samplesize
+from satprocess.errors import SatProcessError
+
+
+class TestStatistics(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.values = np.random.normal(0.2, 0.1, 100000)
+
+    def test_merge(self):
+        """ Stats merged from blocks match stats of all values """
+        stats = Stats(bounds=(-1, 1))
+        for block in np.array_split(self.values, 7):
+            stats.merge(Stats(bounds=(-1, 1)).update(block))
+        self.assertEqual(stats.count, self.values.size)
+        self.assertAlmostEqual(stats.mean, self.values.mean())
+        self.assertAlmostEqual(stats.variance, self.values.var())
+        self.assertEqual(stats.min, self.values.min())
+        self.assertEqual(stats.hist.sum(), self.values.size)
+
+    def test_percentile(self):
+        """ Percentiles from histograms and samples """
+        expected = np.percentile(self.values, [2, 50, 98])
+        stats = Stats(bounds=(-1, 1), bins=2000).update(self.values)
+        self.assertTrue(np.abs(stats.percentile([2, 50, 98]) - expected).max() < 0.001)
+        n = samplesize(0.01)
+        stats = Stats(sampled=True).update(self.values[:n])
+        # within 1% of ranks
+        for p, v in zip([2, 50, 98], stats.percentile([2, 50, 98])):
+            self.assertTrue(abs((self.values < v).mean() * 100 - p) < 1)
+        self.assertTrue('p50' in stats.summary())
+        with self.assertRaises(SatProcessError):
+            Stats().update(self.values).percentile(50)
+
+    def test_samplesize(self):
+        self.assertEqual(samplesize(0.01), 18445)
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Pool
+from satprocess.workqueue import WorkQueue
+
+
+def claim_all(args):
+    """ Claim and ack tasks until none are left, returning ids claimed """
+    filename, worker = args
+    queue = WorkQueue(filename)
+    ids = []
+    task = queue.claim(worker)
+    while task is not None:
+        ids.append(task[0])
+        queue.ack(task[0], worker)
+        task = queue.claim(worker)
+    queue.close()
+    return ids
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'queue.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_queue(self):
+        """ Claim and ack tasks in order """
+        queue = WorkQueue(self.filename)
+        self.assertTrue(queue.put('a', {'path': 'a'}))
+        self.assertFalse(queue.put('a', {'path': 'a'}))
+        queue.put('b', {'path': 'b'})
+        self.assertEqual(queue.claim('w1'), ('a', {'path': 'a'}))
+        self.assertEqual(queue.claim('w2')[0], 'b')
+        self.assertEqual(queue.claim('w1'), None)
+        self.assertFalse(queue.ack('a', 'w2'))
+        self.assertTrue(queue.ack('a', 'w1'))
+        self.assertEqual(queue.counts(), {'done': 1, 'claimed': 1})
+        queue.close()
+
+    def test_retry(self):
+        """ Failed tasks are retried, then failed """
+        queue = WorkQueue(self.filename, retries=2)
+        queue.put('a', {})
+        for i in range(2):
+            id, payload = queue.claim('w1')
+            self.assertTrue(queue.fail(id, 'w1', 'error %s' % i))
+        self.assertEqual(queue.claim('w1'), None)
+        self.assertEqual(queue.failures(), {'a': 'error 1'})
+        queue.close()
+
+    def test_lease(self):
+        """ Tasks with expired leases are claimed by other workers """
+        queue = WorkQueue(self.filename, lease=-1, retries=2)
+        queue.put('a', {})
+        queue.claim('w1')
+        self.assertFalse(queue.heartbeat('a', 'w2'))
+        self.assertEqual(queue.claim('w2')[0], 'a')
+        # the original worker lost the task
+        self.assertFalse(queue.ack('a', 'w1'))
+        # out of retries once the second lease expires
+        self.assertEqual(queue.claim('w3'), None)
+        self.assertEqual(queue.counts(), {'failed': 1})
+        queue.close()
+
+    def test_workers(self):
+        """ Each task is claimed by exactly one of many worker processes """
+        queue = WorkQueue(self.filename)
+        for i in range(50):
+            queue.put(str(i), {})
+        queue.close()
+        pool = Pool(4)
+        ids = pool.map(claim_all, [(self.filename, 'w%s' % i) for i in range(4)])
+        pool.close()
+        pool.join()
+        self.assertEqual(sorted(sum(ids, [])), sorted([str(i) for i in range(50)]))